@@ -2,17 +2,46 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import os
+import json
 import httpx
 import re
+import asyncio
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from fastapi import FastAPI, HTTPException, APIRouter
+from fastapi import FastAPI, HTTPException, APIRouter, Query, Header, Response
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import StreamingResponse, FileResponse, PlainTextResponse, JSONResponse
 from typing import Dict, Any, Optional
 
 from .models import ChatMessageIn, ChatMessageOut, TravelerPreferences
-from .services.db import save_chat_message, get_traveler_conversation, clear_traveler_conversation
+from .services.db import (
+    save_chat_message, get_traveler_conversation, clear_traveler_conversation,
+    get_traveler_conversation_page, get_message_itinerary, iter_traveler_messages,
+    get_conversation_state, get_recent_messages, save_conversation_state,
+)
+from .services.conversation_state import (
+    state_from_messages, record_user_turn, record_assistant_turn, render_state, clip_message,
+)
 from .services.ollama_client import extract_trip_json
+from .services.semantic_cache import trip_cache
+from .services.session_cache import session_cache
+from .services.profiling import (
+    PROFILING_ENABLED, profile_requests, start_loop_lag_monitor, stop_loop_lag_monitor,
+    is_admin, list_profiles, profile_path, profile_summary,
+)
 from .services.planner import build_itinerary
+from .services.locations import canonicalize_location, location_stats
+from .services.jobs import jobs_enabled, enqueue_job, get_job, wait_for_job, start_workers, stop_workers
+from .services.http_clients import get_client, close_clients
+from .services.warmup import warm_up, is_ready, readiness
+from .services.idempotency import run_idempotent, request_fingerprint
+from .services.export import (
+    is_export_admin, parse_checkpoint, iter_export_rows, ndjson_lines, csv_lines,
+)
+from .services.stages import StageGraph, timed_stage, request_timings, server_timing_header
+from .services.deadline import DeadlineExceeded, deadline_scope, clamp_budget, within_deadline, JOB_DEADLINE_SECONDS
 
 # Booking service URL
 BOOKING_SERVICE_URL = os.getenv("BOOKING_SERVICE_URL", "http://booking-service:7004")
@@ -24,7 +53,21 @@ print(" MONGO_URI =", os.getenv("MONGO_URI"))
 # FastAPI App Setup
 # -----------------------------
 PORT = int(os.getenv("PORT", "7005"))
-app = FastAPI(title="AI Service (Ollama + Mongo)", version="1.0.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm-up runs in the background so liveness is answered at once; /ai/ready reports when it is done
+    warmup_task = asyncio.create_task(warm_up(pools={"booking": BOOKING_SERVICE_URL}))
+    start_loop_lag_monitor()
+    if jobs_enabled():
+        start_workers(run_chat_job)
+    yield
+    warmup_task.cancel()
+    await stop_workers()
+    await stop_loop_lag_monitor()
+    await close_clients()
+
+app = FastAPI(title="AI Service (Ollama + Mongo)", version="1.0.0", lifespan=lifespan)
 
 # Create router with /ai prefix to match ingress routing
 router = APIRouter(prefix="/ai")
@@ -55,6 +98,14 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
+# Compress larger JSON bodies (chat history with embedded itineraries compresses very well)
+GZIP_MIN_SIZE = int(os.getenv("GZIP_MIN_SIZE", "1024"))
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_SIZE)
+
+# On-demand profiling (X-Profile-Token header or PROFILE_SAMPLE_RATE); not installed at all when disabled
+if PROFILING_ENABLED:
+    app.middleware("http")(profile_requests)
+
 # Explicit OPTIONS handler for CORS preflight (handles all paths)
 @app.options("/{full_path:path}")
 async def options_handler(full_path: str):
@@ -75,28 +126,29 @@ async def fetch_traveler_bookings(traveler_id: str) -> list:
     """Fetch traveler's booking history from booking service"""
     try:
         # Increased timeout for booking service
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            # Note: This endpoint requires JWT authentication, which we don't have in the AI service
-            # So this will likely fail, but we'll handle it gracefully
-            # The endpoint is /booking/traveler and expects Authorization header with JWT
-            response = await client.get(
-                f"{BOOKING_SERVICE_URL}/booking/traveler",
-                headers={"X-Traveler-Id": traveler_id}  # Internal service call (may not work without auth)
-            )
-            if response.status_code == 200:
-                data = response.json()
-                print(f"📦 Fetched bookings response: {data}")
-                # The booking service returns an array directly, or empty array if no bookings
-                if isinstance(data, list):
-                    return data
-                # Handle case where it might be wrapped
-                return data.get("bookings", data.get("items", []))
-            elif response.status_code == 401:
-                print(f"⚠️ Booking service requires authentication (401). Cannot fetch bookings without JWT token.")
-                return []
-            else:
-                print(f"⚠️ Booking service returned status {response.status_code}: {response.text}")
-                return []
+        client = get_client("booking")
+        # Note: This endpoint requires JWT authentication, which we don't have in the AI service
+        # So this will likely fail, but we'll handle it gracefully
+        # The endpoint is /booking/traveler and expects Authorization header with JWT
+        response = await within_deadline(client.get(
+            f"{BOOKING_SERVICE_URL}/booking/traveler",
+            headers={"X-Traveler-Id": traveler_id},  # Internal service call (may not work without auth)
+            timeout=30.0,
+        ), cap=30.0)
+        if response.status_code == 200:
+            data = response.json()
+            print(f"📦 Fetched bookings response: {data}")
+            # The booking service returns an array directly, or empty array if no bookings
+            if isinstance(data, list):
+                return data
+            # Handle case where it might be wrapped
+            return data.get("bookings", data.get("items", []))
+        elif response.status_code == 401:
+            print(f"⚠️ Booking service requires authentication (401). Cannot fetch bookings without JWT token.")
+            return []
+        else:
+            print(f"⚠️ Booking service returned status {response.status_code}: {response.text}")
+            return []
     except httpx.ConnectError as e:
         print(f"⚠️ Could not connect to booking service: {e}")
         return []
@@ -275,21 +327,110 @@ def normalize_date(date_str: str) -> Optional[str]:
     
     return date_str  # Return as-is if can't parse
 
+class TransientChatFailure(Exception):
+    """A turn failed for a reason worth retrying (upstream down, out of time); str(e) is the reply shown to the user"""
+
+def _message_id(turn_id: Optional[str], role: str) -> Optional[str]:
+    """Stable message id for a turn that may run more than once, so a rerun does not save it twice"""
+    return f"{turn_id}-{role}" if turn_id else None
+
+async def run_chat_job(job_id: str, payload: Dict[str, Any], attempt: int, max_attempts: int) -> Dict[str, Any]:
+    """
+    Job worker entry point: run the normal chat pipeline for a queued request. Upstream failures
+    raise so the queue retries the job; messages are keyed by the job id so retries do not duplicate them.
+    The last attempt saves its failure reply, as an interactive turn would, before the job is marked failed.
+    """
+    last_attempt = attempt >= max_attempts
+    # Not the interactive budget: nobody is waiting on the response, and the clock starts only now
+    with deadline_scope(JOB_DEADLINE_SECONDS):
+        out = await process_chat(
+            ChatMessageIn(**payload), turn_id=job_id, retryable=not last_attempt,
+            failure_message_id=_message_id(job_id, "assistant") if last_attempt else None,
+        )
+    return out.dict()
+
 @router.post("/chatbot", response_model=ChatMessageOut)
-async def chatbot(req: ChatMessageIn):
+async def chatbot(
+    req: ChatMessageIn,
+    response: Response,
+    mode: Optional[str] = Query(None, description="'async' to queue the request and return a job id"),
+    idempotency_key: Optional[str] = Header(None, max_length=200),
+    x_request_timeout: Optional[float] = Header(None, description="Seconds the client will wait; defaults to REQUEST_DEADLINE_SECONDS"),
+):
+    timings: Dict[str, Any] = {}
+    request_timings.set(timings)
+    budget = clamp_budget(x_request_timeout)
+
+    async def handle() -> Dict[str, Any]:
+        if mode == "async" and jobs_enabled():
+            job_id = await enqueue_job("chat", req.dict())
+            print(f"🧵 Queued chat job {job_id} for traveler {req.traveler_id}")
+            return ChatMessageOut(reply="I'm working on your itinerary. I'll have it ready shortly.", job_id=job_id).dict()
+        with deadline_scope(budget):
+            return (await process_chat(req, turn_id=turn_id)).dict()
+
+    turn_id = None
+    try:
+        if not idempotency_key:
+            result = await handle()
+        else:
+            # Retries with the same Idempotency-Key share one pipeline run and one set of saved messages
+            turn_id = request_fingerprint(req.traveler_id, idempotency_key)[:32]
+            fingerprint = request_fingerprint(req.traveler_id, req.message, req.booking_context, mode)
+            result = await run_idempotent(f"{req.traveler_id}:{idempotency_key}", fingerprint, handle)
+    except TransientChatFailure as failure:
+        # Raised through run_idempotent so the key is released: a retry runs the turn again
+        # instead of getting this failure back for the rest of the TTL
+        result = ChatMessageOut(reply=str(failure)).dict()
+    if timings:
+        response.headers["Server-Timing"] = server_timing_header(timings)
+    return result
+
+async def process_chat(
+    req: ChatMessageIn,
+    turn_id: Optional[str] = None,
+    retryable: bool = False,
+    failure_message_id: Optional[str] = None,
+) -> ChatMessageOut:
+    """
+    Run one chat turn. Failures worth retrying raise TransientChatFailure; unless the caller will
+    retry the turn itself (`retryable`), the failure reply is saved to the conversation first, under
+    `failure_message_id` when given (a job's last attempt, which may still be rerun after a lost lease).
+    """
+    async def transient_failure(reply: str):
+        if not retryable:
+            await save_chat_message(req.traveler_id, "assistant", reply, None, message_id=failure_message_id)
+        raise TransientChatFailure(reply)
+
     try:
         print(f"📥 Received chat request from traveler {req.traveler_id}: {req.message}")
         print(f"📦 Booking context: {req.booking_context}")
         
-        # 1️⃣ Save user message
-        await save_chat_message(req.traveler_id, "user", req.message, None)
-
-        # 2️⃣ Check if user wants to fetch booking history
+        # 1️⃣ Check if user wants to fetch booking history
         message_lower = req.message.lower()
         fetch_bookings = any(keyword in message_lower for keyword in [
             "booking", "travel history", "recent booking", "my booking", 
             "pull booking", "check booking", "past booking"
         ])
+
+        # 2️⃣ Independent I/O runs concurrently: persist the user message, load conversation state
+        # and (only when needed) fetch bookings
+        async def load_state(_):
+            state = await get_conversation_state(req.traveler_id)
+            if state is None:
+                # Conversations from before state tracking: seed from the last few messages, excluding this one
+                await graph.wait("save_user_message")
+                state = state_from_messages((await get_recent_messages(req.traveler_id, 7))[:-1])
+            return state
+
+        graph = StageGraph()
+        graph.add("save_user_message", lambda _: save_chat_message(
+            req.traveler_id, "user", req.message, None, message_id=_message_id(turn_id, "user")
+        ))
+        graph.add("load_state", load_state)
+        if fetch_bookings and not req.booking_context:
+            graph.add("fetch_bookings", lambda _: fetch_traveler_bookings(req.traveler_id))
+        stage_results = await graph.run()
         
         # 3️⃣ Get booking context (from frontend or fetch if needed)
         booking_context = ""
@@ -309,7 +450,7 @@ async def chatbot(req: ChatMessageIn):
             booking_context += "\n"
         elif fetch_bookings:
             # Try to fetch from booking service (may fail without auth)
-            bookings = await fetch_traveler_bookings(req.traveler_id)
+            bookings = stage_results["fetch_bookings"]
             # Handle different response formats: list, dict with 'bookings' key, or dict with 'items' key
             booking_list = []
             if isinstance(bookings, list):
@@ -341,9 +482,9 @@ async def chatbot(req: ChatMessageIn):
             else:
                 booking_context = "\nNo recent bookings found.\n"
 
-        # 4️⃣ Build conversation history
-        prior = await get_traveler_conversation(req.traveler_id)
-        history_text = "\n".join(f"{m['role']}: {m['content']}" for m in prior[-6:])
+        # 4️⃣ Use the rolling conversation state (bounded size) instead of raw history
+        state = stage_results["load_state"]
+        state_text = render_state(state)
 
         # 5️⃣ Build improved Ollama prompt with date format examples
         # If we have booking context with dates, prioritize using those
@@ -376,22 +517,29 @@ WRONG formats (DO NOT USE):
 - "2025-11" ✗ WRONG - missing day and end date
 - "11 to 20" ✗ WRONG - missing year and month format
 
-{booking_context}Conversation:
-{history_text}
-User: {req.message}
+{booking_context}{state_text}
+Use the known trip details for any field the user does not change.
+
+User: {clip_message(req.message)}
 
 Return JSON only, no other text. The dates field MUST be in "YYYY-MM-DD to YYYY-MM-DD" format with all parts (year, month, day) for both start and end dates."""
 
         # 4️⃣ Extract structured trip info from Mistral
         # Wrap in try-except to handle Ollama connection errors gracefully
         try:
-            parsed: Dict[str, Any] = await extract_trip_json(prompt)
+            async with timed_stage("extract_trip"):
+                parsed: Dict[str, Any] = await extract_trip_json(
+                    prompt, cache_key=f"{booking_context}\n{state_text}\n{req.message}"
+                )
+        except DeadlineExceeded:
+            print(f"⏱️ Deadline reached during trip extraction for traveler {req.traveler_id}")
+            await transient_failure("That took longer than expected and I ran out of time understanding your request. Please try again, or share your destination and dates directly.")
         except Exception as ollama_error:
             print(f"⚠️ Ollama error: {ollama_error}")
             # If Ollama is unavailable, provide a simple response
-            reply = "I'm having trouble connecting to the AI service right now. Please try again in a moment, or provide your travel details directly (destination and dates)."
-            await save_chat_message(req.traveler_id, "assistant", reply, None)
-            return ChatMessageOut(reply=reply)
+            await transient_failure("I'm having trouble connecting to the AI service right now. Please try again in a moment, or provide your travel details directly (destination and dates).")
+
+        record_user_turn(state, req.message, parsed)
 
         location = parsed.get("location")
         dates_raw = parsed.get("dates")
@@ -522,6 +670,14 @@ Return JSON only, no other text. The dates field MUST be in "YYYY-MM-DD to YYYY-
                 except Exception as e:
                     print(f"⚠️ Error extracting dates from message: {e}")
 
+        # Map LLM free text ("new york, ny", "San Fransisco") onto its canonical name before any lookups;
+        # aliases and areas ("Brooklyn") keep the user's wording so searches are not widened to the metro
+        if location:
+            canonical = canonicalize_location(location)
+            if canonical.id:
+                print(f"📍 Canonical location: {location} -> {canonical.query} ({canonical.name}, {canonical.match})")
+            location = canonical.query
+
         # 5️⃣ Generate itinerary if we have enough info
         if location and dates:
             try:
@@ -592,7 +748,8 @@ Return JSON only, no other text. The dates field MUST be in "YYYY-MM-DD to YYYY-
                 )
 
                 print(f"🚀 Starting itinerary generation for {location} on {dates}")
-                itinerary = await build_itinerary(location, dates, party_type, prefs)
+                async with timed_stage("build_itinerary"):
+                    itinerary = await build_itinerary(location, dates, party_type, prefs)
                 print(f"✅ Itinerary generated successfully")
                 
                 # Format dates nicely for display - use the actual dates from itinerary if available
@@ -606,12 +763,18 @@ Return JSON only, no other text. The dates field MUST be in "YYYY-MM-DD to YYYY-
                     display_dates = dates.replace(" to ", " to ")
                 
                 reply = f"I built a {party_type} itinerary for {location} ({display_dates}). Here's your personalized travel plan!"
+                if itinerary.partial:
+                    missing_text = ", ".join(s.replace("_", " ") for s in itinerary.missing_sections)
+                    reply += f" Some sections ran out of time and are missing ({missing_text}); ask again to fill them in."
                 # Convert Pydantic model to dict for storage
                 itinerary_dict = itinerary.dict() if hasattr(itinerary, 'dict') else (itinerary.model_dump() if hasattr(itinerary, 'model_dump') else itinerary)
-                await save_chat_message(req.traveler_id, "assistant", reply, itinerary_dict)
+                await save_chat_message(req.traveler_id, "assistant", reply, itinerary_dict, message_id=_message_id(turn_id, "assistant"))
+                record_assistant_turn(state, f"built a {party_type} itinerary for {location} ({display_dates})")
+                await save_conversation_state(req.traveler_id, state)
 
                 return ChatMessageOut(reply=reply, itinerary=itinerary)
-            except Exception as itinerary_error:
+            except ValueError as itinerary_error:
+                # Dates that cannot be used; retrying the same turn would fail the same way
                 import traceback
                 error_trace = traceback.format_exc()
                 print(f"⚠️ Itinerary generation error: {itinerary_error}")
@@ -623,8 +786,14 @@ Return JSON only, no other text. The dates field MUST be in "YYYY-MM-DD to YYYY-
                     reply = f"Great! I see you want to travel to {location} on {display_dates}. I encountered an issue generating your itinerary: {str(itinerary_error)[:100]}. Please try again."
                 except:
                     reply = f"Great! I see you want to travel to {location}. I encountered an issue generating your itinerary. Please try again or provide your travel details in a different format."
-                await save_chat_message(req.traveler_id, "assistant", reply, None)
+                await save_chat_message(req.traveler_id, "assistant", reply, None, message_id=_message_id(turn_id, "assistant"))
+                await save_conversation_state(req.traveler_id, state)
                 return ChatMessageOut(reply=reply)
+            except Exception as itinerary_error:
+                import traceback
+                print(f"⚠️ Itinerary generation error: {itinerary_error}")
+                print(f"📋 Full traceback:\n{traceback.format_exc()}")
+                await transient_failure(f"Great! I see you want to travel to {location}. I encountered an issue generating your itinerary. Please try again.")
 
         # 6️⃣ If missing info, provide helpful guidance
         missing = []
@@ -641,11 +810,13 @@ Return JSON only, no other text. The dates field MUST be in "YYYY-MM-DD to YYYY-
         else:
             reply = "I need a bit more information. Please provide your destination and travel dates."
         
-        await save_chat_message(req.traveler_id, "assistant", reply, None)
+        await save_chat_message(req.traveler_id, "assistant", reply, None, message_id=_message_id(turn_id, "assistant"))
+        record_assistant_turn(state, reply)
+        await save_conversation_state(req.traveler_id, state)
         return ChatMessageOut(reply=reply)
 
-    except HTTPException:
-        # Re-raise HTTP exceptions as-is
+    except (HTTPException, TransientChatFailure):
+        # Re-raise HTTP exceptions and already-handled failures as-is
         raise
     except Exception as e:
         import traceback
@@ -654,21 +825,63 @@ Return JSON only, no other text. The dates field MUST be in "YYYY-MM-DD to YYYY-
         print(f"❌ Error in /chatbot: {error_msg}")
         print(f"📋 Full traceback:\n{error_trace}")
         # Return a user-friendly error message instead of crashing with 500
-        try:
-            await save_chat_message(req.traveler_id, "assistant", "I encountered an error. Please try again or rephrase your request.", None)
-        except:
-            pass  # If even saving fails, just continue
-        # Return error response instead of raising HTTPException to avoid 500
-        return ChatMessageOut(reply="I encountered an error processing your request. Please try again or rephrase your message.")
+        if not retryable:
+            try:
+                await save_chat_message(
+                    req.traveler_id, "assistant", "I encountered an error. Please try again or rephrase your request.", None,
+                    message_id=failure_message_id,
+                )
+            except:
+                pass  # If even saving fails, just continue
+        raise TransientChatFailure("I encountered an error processing your request. Please try again or rephrase your message.")
+
 
+# -----------------------------
+# Itinerary Job Status Endpoint
+# -----------------------------
+@router.get("/jobs/{job_id}")
+async def job_status(job_id: str, wait: float = Query(0, ge=0, le=60, description="Seconds to long-poll for completion")):
+    job = await wait_for_job(job_id, wait) if wait else await get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] in ("succeeded", "failed") and job.get("traveler_id"):
+        # The job may have run on another pod and saved state this pod's session cache has not seen;
+        # drop it so the next turn (sticky to this pod) does not write the stale state back over it
+        session_cache.invalidate(job["traveler_id"])
+    return job
 
 # -----------------------------
 # Chat History Endpoint
 # -----------------------------
 @router.get("/chatbot/history/{traveler_id}")
-async def history(traveler_id: str):
-    msgs = await get_traveler_conversation(traveler_id)
-    return {"messages": msgs}
+async def history(
+    traveler_id: str,
+    before: Optional[int] = Query(None, ge=0, description="Return messages older than this index (cursor)"),
+    limit: Optional[int] = Query(None, ge=1, le=200, description="Page size; omit to return the full history"),
+    include_itineraries: bool = Query(True, description="Set false to strip itineraries and fetch them lazily"),
+):
+    if limit is None and before is None and include_itineraries:
+        # Legacy behaviour: the whole conversation in one body
+        msgs = await get_traveler_conversation(traveler_id)
+        return {"messages": msgs}
+    return await get_traveler_conversation_page(
+        traveler_id, before=before, limit=limit or 20, include_itineraries=include_itineraries
+    )
+
+@router.get("/chatbot/history/{traveler_id}/messages/{message_id}/itinerary")
+async def message_itinerary(traveler_id: str, message_id: str):
+    itinerary = await get_message_itinerary(traveler_id, message_id)
+    if itinerary is None:
+        raise HTTPException(status_code=404, detail="Itinerary not found")
+    return {"itinerary": itinerary}
+
+@router.get("/chatbot/history/{traveler_id}/export")
+async def export_history(traveler_id: str):
+    """Stream the full conversation as NDJSON, one message per line"""
+    async def lines():
+        async for msg in iter_traveler_messages(traveler_id):
+            yield json.dumps(jsonable_encoder(msg)) + "\n"
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
 # -----------------------------
 # Clear Chat History Endpoint
@@ -679,6 +892,62 @@ async def clear_history(traveler_id: str):
     return {"message": "Chat history cleared"}
 
 
+# -----------------------------
+# Location Canonicalization Metrics
+# -----------------------------
+@router.get("/locations/stats")
+async def locations_stats():
+    return location_stats()
+
+@router.get("/cache/stats")
+async def cache_stats():
+    return {"trip_extraction": trip_cache.cache_stats(), "sessions": session_cache.cache_stats()}
+
+# -----------------------------
+# Profiling Admin Endpoints
+# -----------------------------
+@router.get("/admin/profiles")
+async def profiles(x_profile_token: Optional[str] = Header(None)):
+    if not is_admin(x_profile_token):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return {"profiles": list_profiles()}
+
+@router.get("/admin/profiles/{name}")
+async def download_profile(name: str, format: str = Query("prof", regex="^(prof|text)$"), x_profile_token: Optional[str] = Header(None)):
+    if not is_admin(x_profile_token):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    path = profile_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "text":
+        return PlainTextResponse(profile_summary(path))
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{name}.prof")
+
+# -----------------------------
+# Analytics Export Endpoint
+# -----------------------------
+@router.get("/admin/export")
+async def export_conversations(
+    table: str = Query("messages", regex="^(messages|days|activities)$"),
+    format: str = Query("ndjson", regex="^(ndjson|csv)$"),
+    since: Optional[datetime] = Query(None, description="Only messages at or after this time"),
+    until: Optional[datetime] = Query(None, description="Only messages before this time"),
+    after: Optional[str] = Query(None, description="Resume after this row checkpoint"),
+    x_admin_token: Optional[str] = Header(None),
+):
+    if not is_export_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    if after:
+        try:
+            parse_checkpoint(after)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid checkpoint")
+    rows = iter_export_rows(table, since=since, until=until, after=after)
+    if format == "csv":
+        return StreamingResponse(csv_lines(rows, table), media_type="text/csv",
+                                 headers={"Content-Disposition": f'attachment; filename="{table}.csv"'})
+    return StreamingResponse(ndjson_lines(rows), media_type="application/x-ndjson")
+
 # -----------------------------
 # Health Check Endpoint
 # -----------------------------
@@ -686,5 +955,14 @@ async def clear_history(traveler_id: str):
 async def health():
     return {"status": "ok"}
 
+# -----------------------------
+# Readiness Endpoint (model loaded, Mongo primed, indexes built)
+# -----------------------------
+@router.get("/ready")
+async def ready():
+    if not is_ready():
+        return JSONResponse(status_code=503, content=jsonable_encoder(readiness()))
+    return readiness()
+
 # Include the router in the app
 app.include_router(router)
@@ -53,6 +53,8 @@ class ConciergeResponse(BaseModel):
     packing_checklist: List[PackingItem]
     weather_info: Optional[Dict[str, Any]] = None
     local_events: Optional[List[Dict[str, Any]]] = None
+    partial: bool = False  # True when the request deadline ran out before every section was fetched
+    missing_sections: List[str] = []
 
 # Chat
 class ChatMessageIn(BaseModel):
@@ -63,3 +65,4 @@ class ChatMessageIn(BaseModel):
 class ChatMessageOut(BaseModel):
     reply: str
     itinerary: Optional[ConciergeResponse] = None
+    job_id: Optional[str] = None  # Set when the request was queued with ?mode=async
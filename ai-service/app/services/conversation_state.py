@@ -0,0 +1,63 @@
+import os, json
+from typing import Dict, Any, List, Optional
+
+SUMMARY_MAX_CHARS = int(os.getenv("SUMMARY_MAX_CHARS", "600"))
+MESSAGE_MAX_CHARS = int(os.getenv("PROMPT_MESSAGE_MAX_CHARS", "1000"))
+SUMMARY_LINE_CHARS = 160
+TRIP_FIELDS = ("location", "dates", "party_type", "budget", "interests", "dietary_filters")
+MAX_LIST_ITEMS = 8
+MAX_FIELD_CHARS = 80
+
+def empty_state() -> Dict[str, Any]:
+    return {"trip": {}, "summary": [], "turns": 0}
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join(str(text or "").split())
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+def _clean_value(value: Any) -> Any:
+    if isinstance(value, list):
+        items = list(dict.fromkeys(_clip(v, MAX_FIELD_CHARS) for v in value if v))
+        return items[:MAX_LIST_ITEMS] or None
+    if isinstance(value, str):
+        return _clip(value, MAX_FIELD_CHARS) or None
+    return None
+
+def _add_line(state: Dict[str, Any], line: str):
+    """Append a summary line and drop the oldest lines until the summary fits its budget"""
+    lines: List[str] = state["summary"]
+    lines.append(_clip(line, SUMMARY_LINE_CHARS))
+    while len(lines) > 1 and sum(len(l) + 1 for l in lines) > SUMMARY_MAX_CHARS:
+        lines.pop(0)
+
+def state_from_messages(messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Seed state for conversations stored before state tracking existed"""
+    state = empty_state()
+    for m in messages:
+        _add_line(state, f"{m.get('role', 'user')}: {m.get('content', '')}")
+    return state
+
+def record_user_turn(state: Dict[str, Any], message: str, parsed: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Merge newly extracted trip fields (non-empty values win) and note the user's message"""
+    trip = state.setdefault("trip", {})
+    for field in TRIP_FIELDS:
+        value = _clean_value((parsed or {}).get(field))
+        if value:
+            trip[field] = value
+    state["turns"] = state.get("turns", 0) + 1
+    _add_line(state, f"user: {message}")
+    return state
+
+def record_assistant_turn(state: Dict[str, Any], note: str) -> Dict[str, Any]:
+    _add_line(state, f"assistant: {note}")
+    return state
+
+def render_state(state: Dict[str, Any]) -> str:
+    """Prompt section built from the state; its size is bounded by the caps above, not by history length"""
+    trip = {k: v for k, v in state.get("trip", {}).items() if v}
+    known = json.dumps(trip, ensure_ascii=False) if trip else "none yet"
+    summary = "\n".join(state.get("summary", [])) or "(new conversation)"
+    return f"Known trip details so far: {known}\nConversation summary:\n{summary}"
+
+def clip_message(message: str) -> str:
+    return _clip(message, MESSAGE_MAX_CHARS)
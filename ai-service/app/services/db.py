@@ -1,43 +1,321 @@
 import os
+import copy
+import json
+import uuid
+import asyncio
+import hashlib
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, AsyncIterator
 from motor.motor_asyncio import AsyncIOMotorClient
 
+from .session_cache import session_cache, SESSION_TAIL
+
 MONGO_URI = os.getenv("MONGO_URI")
 DB_NAME = os.getenv("MONGO_DB", "airbnb_db")
+EXPORT_BATCH_SIZE = int(os.getenv("HISTORY_EXPORT_BATCH_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "5"))
 
-client = AsyncIOMotorClient(MONGO_URI) if MONGO_URI else None
+client = AsyncIOMotorClient(MONGO_URI, minPoolSize=MONGO_MIN_POOL_SIZE) if MONGO_URI else None
 db = client[DB_NAME] if client is not None else None
 conversations = db["traveler_conversations"] if db is not None else None
+itineraries = db["itineraries"] if db is not None else None
+
+async def prime_mongo():
+    """Open the connection pool up front: one concurrent ping per pooled connection"""
+    if client is None:
+        return
+    await asyncio.gather(*(client.admin.command("ping") for _ in range(max(MONGO_MIN_POOL_SIZE, 1))))
 
-async def save_chat_message(traveler_id: str, role: str, content: str, itinerary: Dict[str, Any] = None):
+async def ensure_indexes():
+    if conversations is None:
+        return
+    await conversations.create_index("traveler_id")
+    # Lets history pages and lazy itinerary fetches find a message by id
+    await conversations.create_index([("traveler_id", 1), ("messages.id", 1)])
+    await backfill_message_ids()
+
+async def backfill_message_ids():
+    """
+    Give messages saved before ids existed a stable id ("<conversation id>-<position>") so their
+    itineraries can be fetched lazily by id like any other message. Messages are only ever
+    appended, so a position never changes; conversations that are already complete are skipped.
+    """
+    if conversations is None:
+        return
+    with_ids = {"$map": {
+        "input": {"$range": [0, {"$size": "$messages"}]},
+        "as": "i",
+        "in": {"$let": {
+            "vars": {"m": {"$arrayElemAt": ["$messages", "$$i"]}},
+            "in": {"$mergeObjects": [
+                {"id": {"$concat": [{"$toString": "$_id"}, "-", {"$toString": "$$i"}]}},
+                "$$m",
+            ]},
+        }},
+    }}
+    result = await conversations.update_many(
+        {"messages": {"$elemMatch": {"id": {"$exists": False}}}},
+        [{"$set": {"messages": with_ids}}],
+    )
+    if result.modified_count:
+        print(f"🗂️ Backfilled message ids in {result.modified_count} conversations")
+
+def itinerary_hash(itinerary: Dict[str, Any]) -> str:
+    """Content address: SHA-256 of the itinerary serialised with sorted keys"""
+    canonical = json.dumps(itinerary, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+async def store_itinerary(itinerary: Dict[str, Any]) -> str:
+    """Store an itinerary once per distinct content and count one more reference to it"""
+    ref = itinerary_hash(itinerary)
+    now = datetime.utcnow()
+    await itineraries.update_one(
+        {"_id": ref},
+        {
+            "$setOnInsert": {"itinerary": itinerary, "created_at": now},
+            "$inc": {"refcount": 1},
+            "$set": {"last_referenced_at": now},
+        },
+        upsert=True,
+    )
+    return ref
+
+async def release_itineraries(refs: List[str]):
+    """Drop one reference per entry in `refs` and delete itineraries nobody points to any more"""
+    if itineraries is None or not refs:
+        return
+    counts: Dict[str, int] = {}
+    for ref in refs:
+        counts[ref] = counts.get(ref, 0) + 1
+    for ref, n in counts.items():
+        await itineraries.update_one({"_id": ref}, {"$inc": {"refcount": -n}})
+    await itineraries.delete_many({"_id": {"$in": list(counts)}, "refcount": {"$lte": 0}})
+
+async def _expand_itineraries(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Replace `itinerary_ref` on messages with the stored itinerary (one query per call)"""
+    refs = {m["itinerary_ref"] for m in messages if m.get("itinerary_ref")}
+    if not refs or itineraries is None:
+        return messages
+    stored = {doc["_id"]: doc["itinerary"] async for doc in itineraries.find({"_id": {"$in": list(refs)}})}
+    for m in messages:
+        ref = m.pop("itinerary_ref", None)
+        if ref and ref in stored:
+            m["itinerary"] = stored[ref]
+    return messages
+
+async def save_chat_message(traveler_id: str, role: str, content: str, itinerary: Dict[str, Any] = None,
+                            message_id: Optional[str] = None):
+    """
+    Append a message. A caller that may run the same turn twice (job retries, idempotent
+    requests) passes a stable `message_id`; the message is then only appended if no message
+    with that id is stored yet.
+    """
     if conversations is None:
         print("⚠️ MongoDB collection not initialized")
         return
     now = datetime.utcnow()
-    message_data = {"role": role, "content": content, "timestamp": now}
+    message_data = {"id": message_id or uuid.uuid4().hex, "role": role, "content": content, "timestamp": now}
     if itinerary:
-        message_data["itinerary"] = itinerary
-    await conversations.update_one(
+        # Messages only point at the plan; identical plans are stored once in `itineraries`
+        message_data["itinerary_ref"] = await store_itinerary(itinerary)
+    if message_id is None:
+        await conversations.update_one(
+            {"traveler_id": traveler_id},
+            {
+                "$push": {"messages": message_data},
+                "$setOnInsert": {"created_at": now},
+                "$set": {"updated_at": now},
+            },
+            upsert=True
+        )
+        session_cache.append_message(traveler_id, message_data)
+        return
+
+    stored = {"$in": [message_id, {"$ifNull": ["$messages.id", []]}]}
+    result = await conversations.update_one(
         {"traveler_id": traveler_id},
-        {
-            "$push": {"messages": message_data},
-            "$setOnInsert": {"created_at": now},
-            "$set": {"updated_at": now},
-        },
-        upsert=True
+        [{"$set": {
+            "messages": {"$cond": [
+                stored,
+                "$messages",
+                # $literal: message content must never be read as a field path or operator
+                {"$concatArrays": [{"$ifNull": ["$messages", []]}, [{"$literal": message_data}]]},
+            ]},
+            "created_at": {"$ifNull": ["$created_at", now]},
+            "updated_at": {"$cond": [stored, "$updated_at", now]},
+        }}],
+        upsert=True,
     )
+    if result.upserted_id is None and result.modified_count == 0:
+        # Already saved by an earlier attempt; drop the extra itinerary reference taken above
+        await release_itineraries([message_data["itinerary_ref"]] if itinerary else [])
+        return
+    session_cache.append_message(traveler_id, message_data)
 
 async def clear_traveler_conversation(traveler_id: str):
     """Clear all chat history for a traveler"""
     if conversations is None:
         print("⚠️ MongoDB collection not initialized")
         return
-    await conversations.delete_one({"traveler_id": traveler_id})
+    session_cache.invalidate(traveler_id)
+    doc = await conversations.find_one_and_delete(
+        {"traveler_id": traveler_id}, projection={"messages.itinerary_ref": 1}
+    )
+    if doc:
+        await release_itineraries([m["itinerary_ref"] for m in doc.get("messages", []) if m.get("itinerary_ref")])
 
 async def get_traveler_conversation(traveler_id: str) -> List[Dict[str, Any]]:
     if conversations is None:
         print("⚠️ MongoDB collection not initialized")
         return []
     doc = await conversations.find_one({"traveler_id": traveler_id})
+    return await _expand_itineraries(doc.get("messages", [])) if doc else []
+
+async def _load_session(traveler_id: str):
+    """Cached state + message tail for a traveler; one projected read on a miss"""
+    entry = session_cache.get(traveler_id)
+    if entry is not None:
+        return entry.state, [r.to_dict() for r in entry.tail]
+    session_cache.begin_load(traveler_id)
+    try:
+        doc = await conversations.find_one(
+            {"traveler_id": traveler_id}, {"_id": 0, "state": 1, "messages": {"$slice": -SESSION_TAIL}}
+        )
+    except BaseException:
+        session_cache.abort_load(traveler_id)
+        raise
+    state, messages = (doc.get("state"), doc.get("messages", [])) if doc else (None, [])
+    session_cache.finish_load(traveler_id, state, messages)
+    return state, messages
+
+async def get_conversation_state(traveler_id: str) -> Optional[Dict[str, Any]]:
+    """Rolling per-traveler state (trip facts + short summary) kept next to the messages"""
+    if conversations is None:
+        print("⚠️ MongoDB collection not initialized")
+        return None
+    state, _ = await _load_session(traveler_id)
+    # Callers mutate the state before saving it; never hand out the cached object
+    return copy.deepcopy(state)
+
+async def get_recent_messages(traveler_id: str, count: int) -> List[Dict[str, Any]]:
+    """Last `count` messages (itineraries not expanded), from the session cache when it holds enough"""
+    if conversations is None:
+        print("⚠️ MongoDB collection not initialized")
+        return []
+    if count <= SESSION_TAIL:
+        _, messages = await _load_session(traveler_id)
+        return messages[-count:] if count > 0 else []
+    doc = await conversations.find_one({"traveler_id": traveler_id}, {"_id": 0, "messages": {"$slice": -count}})
     return doc.get("messages", []) if doc else []
+
+async def save_conversation_state(traveler_id: str, state: Dict[str, Any]):
+    if conversations is None:
+        print("⚠️ MongoDB collection not initialized")
+        return
+    await conversations.update_one({"traveler_id": traveler_id}, {"$set": {"state": state}}, upsert=True)
+    session_cache.set_state(traveler_id, state)
+
+async def get_traveler_conversation_page(
+    traveler_id: str,
+    before: Optional[int] = None,
+    limit: int = 20,
+    include_itineraries: bool = True,
+) -> Dict[str, Any]:
+    """
+    Return one page of messages ending just before position `before` (newest page when None).
+    Slicing happens inside Mongo so only the requested messages leave the database.
+    Each message carries its `index`, which is the cursor for the next (older) page.
+    """
+    empty = {"messages": [], "total": 0, "next_before": None}
+    if conversations is None:
+        print("⚠️ MongoDB collection not initialized")
+        return empty
+
+    size = {"$size": {"$ifNull": ["$messages", []]}}
+    end = {"$min": [before, size]} if before is not None else size
+    if include_itineraries:
+        entry = {"$mergeObjects": [{"$arrayElemAt": ["$messages", "$$i"]}, {"index": "$$i"}]}
+    else:
+        # Drop the itinerary (embedded or referenced) but flag it so the client can fetch it lazily by message id
+        entry = {"$let": {
+            "vars": {"m": {"$arrayElemAt": ["$messages", "$$i"]}},
+            "in": {"$mergeObjects": [
+                {"$arrayToObject": {"$filter": {
+                    "input": {"$objectToArray": "$$m"},
+                    "cond": {"$not": [{"$in": ["$$this.k", ["itinerary", "itinerary_ref"]]}]},
+                }}},
+                {"index": "$$i", "has_itinerary": {"$or": [
+                    {"$ne": [{"$type": "$$m.itinerary"}, "missing"]},
+                    {"$ne": [{"$type": "$$m.itinerary_ref"}, "missing"]},
+                ]}},
+            ]},
+        }}
+
+    pipeline = [
+        {"$match": {"traveler_id": traveler_id}},
+        {"$project": {
+            "_id": 0,
+            "total": size,
+            "messages": {"$let": {
+                "vars": {"end": {"$max": [end, 0]}},
+                "in": {"$map": {
+                    "input": {"$range": [{"$max": [{"$subtract": ["$$end", limit]}, 0]}, "$$end"]},
+                    "as": "i",
+                    "in": entry,
+                }},
+            }},
+        }},
+    ]
+    docs = await conversations.aggregate(pipeline).to_list(length=1)
+    if not docs:
+        return empty
+    page = docs[0]
+    messages = await _expand_itineraries(page.get("messages", []))
+    first = messages[0]["index"] if messages else 0
+    return {
+        "messages": messages,
+        "total": page.get("total", 0),
+        "next_before": first if first > 0 else None,
+    }
+
+async def get_message_itinerary(traveler_id: str, message_id: str) -> Optional[Dict[str, Any]]:
+    """Fetch the itinerary attached to a single message without loading the rest of the conversation"""
+    if conversations is None:
+        print("⚠️ MongoDB collection not initialized")
+        return None
+    doc = await conversations.find_one(
+        {"traveler_id": traveler_id, "messages.id": message_id},
+        {"_id": 0, "messages": {"$elemMatch": {"id": message_id}}},
+    )
+    if not doc or not doc.get("messages"):
+        return None
+    message = (await _expand_itineraries(doc["messages"]))[0]
+    return message.get("itinerary")
+
+async def iter_traveler_messages(traveler_id: str) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Yield a traveler's messages one at a time through a server-side cursor.
+    $unwind turns each message into its own result document, so the full conversation
+    is never materialised in this process.
+    """
+    if conversations is None:
+        print("⚠️ MongoDB collection not initialized")
+        return
+    pipeline = [
+        {"$match": {"traveler_id": traveler_id}},
+        {"$unwind": {"path": "$messages", "includeArrayIndex": "index"}},
+        {"$replaceRoot": {"newRoot": {"$mergeObjects": ["$messages", {"index": "$index"}]}}},
+    ]
+    cursor = conversations.aggregate(pipeline, batchSize=EXPORT_BATCH_SIZE)
+    seen: Dict[str, Any] = {}  # repeated plans are fetched from the itinerary store once per export
+    async for message in cursor:
+        ref = message.get("itinerary_ref")
+        if ref and ref in seen:
+            message.pop("itinerary_ref")
+            message["itinerary"] = seen[ref]
+        elif ref:
+            message = (await _expand_itineraries([message]))[0]
+            if len(seen) >= 64:
+                seen.clear()
+            seen[ref] = message.get("itinerary")
+        yield message
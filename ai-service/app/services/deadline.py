@@ -0,0 +1,71 @@
+import os, time, asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Awaitable, TypeVar
+
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "90"))
+MAX_REQUEST_DEADLINE_SECONDS = float(os.getenv("MAX_REQUEST_DEADLINE_SECONDS", "300"))
+# Queued (?mode=async) chat jobs have no client waiting on them, so they get their own, longer budget; 0 = none
+JOB_DEADLINE_SECONDS = float(os.getenv("JOB_DEADLINE_SECONDS", "900"))
+# Budget the model call leaves for building the itinerary, so a slow extraction still ends in a (partial) plan
+ITINERARY_RESERVE_SECONDS = float(os.getenv("ITINERARY_RESERVE_SECONDS", "10"))
+
+# Absolute time.monotonic() by which the current request must answer; None outside a request
+# (warm-up, admin tools), where each call keeps only its own fixed timeout
+request_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+T = TypeVar("T")
+
+class DeadlineExceeded(Exception):
+    pass
+
+def clamp_budget(seconds: Optional[float]) -> float:
+    """Client-requested budget (e.g. X-Request-Timeout) limited to the configured range"""
+    if seconds is None or seconds <= 0:
+        return REQUEST_DEADLINE_SECONDS
+    return min(seconds, MAX_REQUEST_DEADLINE_SECONDS)
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]):
+    """Run the block under a deadline `seconds` from now; None or 0 means no overall deadline"""
+    token = request_deadline.set(time.monotonic() + seconds if seconds else None)
+    try:
+        yield
+    finally:
+        request_deadline.reset(token)
+
+def remaining() -> Optional[float]:
+    deadline = request_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+def stage_timeout(cap: float, reserve: float = 0.0) -> float:
+    """
+    Timeout for one upstream call: its own cap or what is left of the request budget
+    (minus `reserve` for later stages, when there is room for it), whichever is smaller.
+    """
+    left = remaining()
+    if left is None:
+        return cap
+    if left <= 0:
+        raise DeadlineExceeded("request deadline exceeded")
+    if left - reserve > 0:
+        left -= reserve
+    return min(cap, left)
+
+async def within_deadline(awaitable: Awaitable[T], cap: float, reserve: float = 0.0) -> T:
+    """
+    Await `awaitable` for at most stage_timeout(cap, reserve) seconds in total. httpx timeouts
+    only bound each network operation, so the overall wait is enforced here.
+    """
+    try:
+        timeout = stage_timeout(cap, reserve)
+    except DeadlineExceeded:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise
+    try:
+        return await asyncio.wait_for(awaitable, timeout=timeout)
+    except asyncio.TimeoutError:
+        if request_deadline.get() is not None and timeout < cap:
+            raise DeadlineExceeded(f"request deadline exceeded after {timeout:.1f}s")
+        raise
@@ -0,0 +1,138 @@
+import io, os, csv, hmac, json
+from datetime import datetime
+from typing import Dict, Any, List, Optional, AsyncIterator
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from pymongo import ReadPreference
+
+from .db import conversations
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+EXPORT_BATCH_SIZE = int(os.getenv("ANALYTICS_EXPORT_BATCH_SIZE", "500"))
+
+TABLE_COLUMNS = {
+    "messages": ["checkpoint", "traveler_id", "message_index", "message_id", "role", "timestamp",
+                 "content", "itinerary_ref", "has_itinerary"],
+    "days": ["checkpoint", "traveler_id", "message_index", "message_id", "timestamp", "itinerary_ref",
+             "day_index", "date", "morning_count", "afternoon_count", "evening_count"],
+    "activities": ["checkpoint", "traveler_id", "message_index", "message_id", "timestamp", "itinerary_ref",
+                   "date", "slot", "position", "title", "address", "price_tier", "duration", "tags",
+                   "wheelchair_friendly", "child_friendly"],
+}
+
+def is_export_admin(token: Optional[str]) -> bool:
+    return bool(ADMIN_TOKEN) and token is not None and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+def parse_checkpoint(token: str) -> tuple:
+    """
+    '<conversation id>:<message index>[:<row>]' -> (ObjectId, int, Optional[int]); the row part is
+    set by the days/activities tables, which emit several rows per message. Raises ValueError when malformed.
+    """
+    conv_id, _, rest = (token or "").partition(":")
+    index, _, row = rest.partition(":")
+    return ObjectId(conv_id), int(index), int(row) if row else None
+
+def _pipeline(since: Optional[datetime], until: Optional[datetime], after: Optional[tuple], with_itineraries: bool) -> List[Dict[str, Any]]:
+    match: Dict[str, Any] = {}
+    # Skip whole conversations that cannot hold messages inside the range
+    if since:
+        match["updated_at"] = {"$gte": since}
+    if until:
+        match["created_at"] = {"$lt": until}
+    if after:
+        match["_id"] = {"$gte": after[0]}
+    pipeline: List[Dict[str, Any]] = [
+        {"$match": match},
+        # Walk conversations in _id order (index-backed), messages in array order, so a checkpoint is stable
+        {"$sort": {"_id": 1}},
+        {"$project": {"traveler_id": 1, "messages": 1}},
+        {"$unwind": {"path": "$messages", "includeArrayIndex": "message_index"}},
+    ]
+    if after:
+        # With a row checkpoint the message itself is read again and its earlier rows skipped
+        pipeline.append({"$match": {"$or": [
+            {"_id": {"$gt": after[0]}},
+            {"message_index": {"$gt" if after[2] is None else "$gte": after[1]}},
+        ]}})
+    ts: Dict[str, Any] = {}
+    if since:
+        ts["$gte"] = since
+    if until:
+        ts["$lt"] = until
+    if ts:
+        pipeline.append({"$match": {"messages.timestamp": ts}})
+    if with_itineraries:
+        pipeline += [
+            {"$match": {"$or": [{"messages.itinerary": {"$exists": True}}, {"messages.itinerary_ref": {"$exists": True}}]}},
+            {"$lookup": {"from": "itineraries", "localField": "messages.itinerary_ref", "foreignField": "_id", "as": "stored"}},
+        ]
+    return pipeline
+
+def _flatten(doc: Dict[str, Any], table: str) -> List[Dict[str, Any]]:
+    m = doc.get("messages") or {}
+    base = {
+        "checkpoint": f"{doc['_id']}:{doc['message_index']}",
+        "traveler_id": doc.get("traveler_id"),
+        "message_index": doc["message_index"],
+        "message_id": m.get("id"),
+        "timestamp": m.get("timestamp"),
+        "itinerary_ref": m.get("itinerary_ref"),
+    }
+    if table == "messages":
+        return [{**base, "role": m.get("role"), "content": m.get("content"),
+                 "has_itinerary": bool(m.get("itinerary") or m.get("itinerary_ref"))}]
+
+    itinerary = m.get("itinerary") or next((s.get("itinerary") for s in doc.get("stored", [])), None) or {}
+    rows = []
+    for day_index, day in enumerate(itinerary.get("day_by_day_plan", [])):
+        if table == "days":
+            rows.append({**base, "day_index": day_index, "date": day.get("date"),
+                         **{f"{slot}_count": len(day.get(slot) or []) for slot in ("morning", "afternoon", "evening")}})
+            continue
+        for slot in ("morning", "afternoon", "evening"):
+            for position, card in enumerate(day.get(slot) or []):
+                rows.append({**base, "date": day.get("date"), "slot": slot, "position": position,
+                             "title": card.get("title"), "address": card.get("address"),
+                             "price_tier": card.get("price_tier"), "duration": card.get("duration"),
+                             "tags": ";".join(card.get("tags") or []),
+                             "wheelchair_friendly": card.get("wheelchair_friendly"),
+                             "child_friendly": card.get("child_friendly")})
+    for position, row in enumerate(rows):
+        row["checkpoint"] = f"{base['checkpoint']}:{position}"
+    return rows
+
+async def iter_export_rows(table: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                           after: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Stream flattened rows through a server-side cursor, one batch in memory at a time.
+    Reads prefer a secondary so analytics traffic stays off the primary that serves chat.
+    """
+    if conversations is None:
+        print("⚠️ MongoDB collection not initialized")
+        return
+    source = conversations.with_options(read_preference=ReadPreference.SECONDARY_PREFERRED)
+    checkpoint = parse_checkpoint(after) if after else None
+    pipeline = _pipeline(since, until, checkpoint, table != "messages")
+    cursor = source.aggregate(pipeline, batchSize=EXPORT_BATCH_SIZE, allowDiskUse=True)
+    async for doc in cursor:
+        rows = _flatten(doc, table)
+        if checkpoint and checkpoint[2] is not None and (doc["_id"], doc["message_index"]) == checkpoint[:2]:
+            rows = rows[checkpoint[2] + 1:]
+        for row in rows:
+            yield row
+
+async def ndjson_lines(rows: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    async for row in rows:
+        yield json.dumps(jsonable_encoder(row), ensure_ascii=False) + "\n"
+
+async def csv_lines(rows: AsyncIterator[Dict[str, Any]], table: str) -> AsyncIterator[str]:
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=TABLE_COLUMNS[table], extrasaction="ignore")
+    writer.writeheader()
+    async for row in rows:
+        writer.writerow(jsonable_encoder(row))
+        if buf.tell() >= 64 * 1024:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
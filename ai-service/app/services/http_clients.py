@@ -0,0 +1,24 @@
+import os, httpx
+from typing import Dict
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_KEEPALIVE_CONNECTIONS", "10"))
+
+# One pooled client per upstream (ollama, tavily, booking, property) shared by all requests,
+# so keep-alive connections opened during warm-up are reused instead of a new TCP/TLS handshake per call
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+def get_client(name: str) -> httpx.AsyncClient:
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0, connect=10.0),
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_KEEPALIVE_CONNECTIONS),
+        )
+        _clients[name] = client
+    return client
+
+async def close_clients():
+    for client in _clients.values():
+        await client.aclose()
+    _clients.clear()
@@ -0,0 +1,138 @@
+import os, time, uuid, socket, asyncio, hashlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Any, Callable, Awaitable, Optional
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError
+
+from .db import db
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "3600"))
+# Kept below the frontend's 180s request timeout so a waiting retry answers before the client gives up
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "150"))
+# An in-progress claim whose lease is not renewed for this long belongs to a dead pod and can be taken over
+IDEMPOTENCY_LEASE_SECONDS = float(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "30"))
+IDEMPOTENCY_MAX_LOCAL = int(os.getenv("IDEMPOTENCY_MAX_LOCAL", "1000"))
+
+idempotency_keys = db["idempotency_keys"] if db is not None else None
+PROCESS_ID = f"{socket.gethostname()}-{os.getpid()}"
+
+# key -> (expires_at, fingerprint, response) for completed requests
+_completed: "OrderedDict[str, tuple]" = OrderedDict()
+# key -> (fingerprint, task) for requests still running in this process
+_in_flight: Dict[str, tuple] = {}
+
+async def ensure_idempotency_indexes():
+    if idempotency_keys is not None:
+        await idempotency_keys.create_index("created_at", expireAfterSeconds=IDEMPOTENCY_TTL_SECONDS)
+
+def request_fingerprint(*parts: Any) -> str:
+    return hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+def _remember(key: str, fingerprint: str, response: Dict[str, Any]):
+    _completed[key] = (time.monotonic() + IDEMPOTENCY_TTL_SECONDS, fingerprint, response)
+    _completed.move_to_end(key)
+    while len(_completed) > IDEMPOTENCY_MAX_LOCAL:
+        _completed.popitem(last=False)
+
+def _check_fingerprint(stored: str, fingerprint: str):
+    if stored != fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+
+async def _claim(key: str, fingerprint: str, owner: str) -> Optional[Dict[str, Any]]:
+    """
+    Claim the key in Mongo for `owner`. Returns None once the claim is ours, or the stored response
+    when another pod finished the request; while another pod holds a live lease, poll for its result.
+    """
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+    delay = 0.25
+    while True:
+        now = datetime.utcnow()
+        lease = {"owner": owner, "lease_expires_at": now + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)}
+        try:
+            await idempotency_keys.insert_one({
+                "_id": key, "fingerprint": fingerprint, "status": "in_progress", "created_at": now, **lease,
+            })
+            return None
+        except DuplicateKeyError:
+            pass
+        doc = await idempotency_keys.find_one({"_id": key})
+        if doc is not None:
+            _check_fingerprint(doc.get("fingerprint"), fingerprint)
+            if doc.get("status") == "done":
+                _remember(key, fingerprint, doc["response"])
+                return doc["response"]
+            # The owner stopped renewing its lease (killed mid-run); run the request here instead
+            taken = await idempotency_keys.find_one_and_update(
+                {"_id": key, "status": "in_progress", "lease_expires_at": {"$lt": now}},
+                {"$set": lease},
+            )
+            if taken is not None:
+                print(f"🔑 Took over Idempotency-Key claim from {taken.get('owner')}")
+                return None
+        # doc is None: the owner failed and released the key between our insert and read; claim it again
+        left = deadline - time.monotonic()
+        if left <= 0:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+        if doc is not None:
+            await asyncio.sleep(min(delay, left))
+            delay = min(delay * 2, 2.0)
+
+async def _renew_claim(key: str, owner: str):
+    while True:
+        await asyncio.sleep(IDEMPOTENCY_LEASE_SECONDS / 3)
+        try:
+            await idempotency_keys.update_one(
+                {"_id": key, "owner": owner, "status": "in_progress"},
+                {"$set": {"lease_expires_at": datetime.utcnow() + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)}},
+            )
+        except Exception as e:
+            print(f"⚠️ Could not renew Idempotency-Key lease: {e}")
+
+async def _claim_and_run(key: str, fingerprint: str, compute: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+    # Unique per claim: a restarted pod can reuse the hostname and pid of the one that died
+    owner = f"{PROCESS_ID}-{uuid.uuid4().hex[:8]}"
+    renewal = None
+    try:
+        if idempotency_keys is not None:
+            stored = await _claim(key, fingerprint, owner)
+            if stored is not None:
+                return stored
+            renewal = asyncio.create_task(_renew_claim(key, owner))
+        try:
+            response = await compute()
+        except BaseException:
+            if idempotency_keys is not None:
+                await idempotency_keys.delete_one({"_id": key, "owner": owner})
+            raise
+        _remember(key, fingerprint, response)
+        if idempotency_keys is not None:
+            await idempotency_keys.update_one(
+                {"_id": key, "owner": owner}, {"$set": {"status": "done", "response": response}},
+            )
+        return response
+    finally:
+        if renewal is not None:
+            renewal.cancel()
+        _in_flight.pop(key, None)
+
+async def run_idempotent(key: str, fingerprint: str, compute: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+    """
+    Run `compute` at most once per key within the TTL. Duplicates attach to the in-flight
+    computation (same process) or wait for the stored response (other process), taking the key
+    over if that process stops renewing its lease. The work runs
+    in its own task, so a client that disconnects does not cancel it for the retry that follows.
+    Only responses are stored: when `compute` raises, the key is released and a retry runs again,
+    so callers raise for failures a retry could fix instead of returning them.
+    """
+    cached = _completed.get(key)
+    if cached is not None and cached[0] > time.monotonic():
+        _check_fingerprint(cached[1], fingerprint)
+        return cached[2]
+
+    running = _in_flight.get(key)
+    if running is None:
+        running = (fingerprint, asyncio.create_task(_claim_and_run(key, fingerprint, compute)))
+        _in_flight[key] = running
+    _check_fingerprint(running[0], fingerprint)
+    return await asyncio.shield(running[1])
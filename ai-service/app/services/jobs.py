@@ -0,0 +1,173 @@
+import os, uuid, socket, asyncio
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, Callable, Awaitable, List
+from pymongo import ReturnDocument
+
+from .db import db
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+JOB_RETENTION_HOURS = int(os.getenv("JOB_RETENTION_HOURS", "24"))
+
+jobs = db["itinerary_jobs"] if db is not None else None
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}"
+
+# handler(job_id, payload, attempt, max_attempts); raising marks the attempt failed so it is retried
+# with backoff until attempt reaches max_attempts. The job id is stable across attempts, so handlers
+# use it to make their writes idempotent.
+JobHandler = Callable[[str, Dict[str, Any], int, int], Awaitable[Dict[str, Any]]]
+
+# Everything but the request payload, whose traveler id is kept so status readers know whose job it was
+_JOB_FIELDS = {f: 1 for f in (
+    "kind", "status", "attempts", "max_attempts", "worker", "result", "error",
+    "created_at", "updated_at", "available_at", "lease_expires_at", "finished_at", "payload.traveler_id",
+)}
+
+_workers: List[asyncio.Task] = []
+_finished: Dict[str, asyncio.Event] = {}
+
+def jobs_enabled() -> bool:
+    return jobs is not None
+
+async def ensure_job_indexes():
+    if jobs is None:
+        return
+    await jobs.create_index([("status", 1), ("available_at", 1)])
+    await jobs.create_index([("status", 1), ("lease_expires_at", 1)])
+    # Finished jobs are removed by Mongo once they are older than the retention window
+    await jobs.create_index("finished_at", expireAfterSeconds=JOB_RETENTION_HOURS * 3600)
+
+async def enqueue_job(kind: str, payload: Dict[str, Any]) -> str:
+    now = datetime.utcnow()
+    job_id = uuid.uuid4().hex
+    await jobs.insert_one({
+        "_id": job_id,
+        "kind": kind,
+        "payload": payload,
+        "status": "queued",
+        "attempts": 0,
+        "max_attempts": JOB_MAX_ATTEMPTS,
+        "created_at": now,
+        "updated_at": now,
+        "available_at": now,
+        "lease_expires_at": None,
+    })
+    return job_id
+
+async def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    if jobs is None:
+        return None
+    doc = await jobs.find_one({"_id": job_id}, _JOB_FIELDS)
+    if doc:
+        doc["id"] = doc.pop("_id")
+        doc["traveler_id"] = (doc.pop("payload", None) or {}).get("traveler_id")
+    return doc
+
+async def wait_for_job(job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+    """Long-poll: return once the job is finished or `timeout` seconds have passed"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        job = await get_job(job_id)
+        remaining = deadline - loop.time()
+        if job is None or job["status"] in ("succeeded", "failed") or remaining <= 0:
+            if job is None or job["status"] in ("succeeded", "failed"):
+                _finished.pop(job_id, None)
+            return job
+        # Wake early when a worker in this process finishes the job; otherwise re-check Mongo
+        event = _finished.setdefault(job_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout=min(remaining, JOB_POLL_INTERVAL * 2))
+        except asyncio.TimeoutError:
+            pass
+
+async def _claim_job() -> Optional[Dict[str, Any]]:
+    now = datetime.utcnow()
+    return await jobs.find_one_and_update(
+        {"$or": [
+            {"status": "queued", "available_at": {"$lte": now}},
+            # A running job whose lease ran out belongs to a worker that died; take it over
+            {"status": "running", "lease_expires_at": {"$lt": now}},
+        ]},
+        {
+            "$set": {
+                "status": "running",
+                "worker": WORKER_ID,
+                "lease_expires_at": now + timedelta(seconds=JOB_LEASE_SECONDS),
+                "updated_at": now,
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("created_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+async def _renew_lease(job_id: str):
+    while True:
+        await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+        try:
+            await jobs.update_one(
+                {"_id": job_id, "worker": WORKER_ID, "status": "running"},
+                {"$set": {"lease_expires_at": datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS)}},
+            )
+        except Exception as e:
+            # Keep renewing; the lease has two more intervals to go before it runs out
+            print(f"⚠️ Could not renew lease for job {job_id}: {e}")
+
+async def _finish_job(job: Dict[str, Any], result: Optional[Dict[str, Any]], error: Optional[str]):
+    now = datetime.utcnow()
+    if error is None:
+        update = {"status": "succeeded", "result": result, "finished_at": now}
+    elif job["attempts"] < job.get("max_attempts", JOB_MAX_ATTEMPTS):
+        # Exponential backoff before the job becomes claimable again
+        delay = 2 ** job["attempts"]
+        update = {"status": "queued", "error": error, "available_at": now + timedelta(seconds=delay)}
+    else:
+        update = {"status": "failed", "error": error, "finished_at": now}
+    update.update({"updated_at": now, "lease_expires_at": None})
+    await jobs.update_one({"_id": job["_id"], "worker": WORKER_ID}, {"$set": update})
+    if update["status"] in ("succeeded", "failed"):
+        event = _finished.pop(job["_id"], None)
+        if event is not None:
+            event.set()
+
+async def _worker_loop(handler: JobHandler):
+    while True:
+        try:
+            job = await _claim_job()
+        except Exception as e:
+            print(f"⚠️ Job queue unavailable: {e}")
+            await asyncio.sleep(JOB_POLL_INTERVAL * 5)
+            continue
+        if job is None:
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+            continue
+
+        print(f"🧵 Worker {WORKER_ID} running job {job['_id']} (attempt {job['attempts']})")
+        lease = asyncio.create_task(_renew_lease(job["_id"]))
+        try:
+            result = await handler(job["_id"], job["payload"], job["attempts"], job.get("max_attempts", JOB_MAX_ATTEMPTS))
+            await _finish_job(job, result, None)
+        except asyncio.CancelledError:
+            # Shutting down: leave the job running so its lease expires and another worker retries it
+            raise
+        except Exception as e:
+            print(f"⚠️ Job {job['_id']} failed: {e}")
+            await _finish_job(job, None, str(e))
+        finally:
+            lease.cancel()
+
+def start_workers(handler: JobHandler, count: int = JOB_WORKERS):
+    if jobs is None or _workers:
+        return
+    for _ in range(count):
+        _workers.append(asyncio.create_task(_worker_loop(handler)))
+    print(f"🧵 Started {count} itinerary job workers ({WORKER_ID})")
+
+async def stop_workers():
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
@@ -0,0 +1,276 @@
+import os, re, json, time, difflib, unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Tuple
+
+from .http_clients import get_client
+
+PROPERTY_SERVICE_URL = os.getenv("PROPERTY_SERVICE_URL", "http://property-service:7002")
+CITIES_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "cities.json")
+REGIONS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "regions.json")
+FUZZY_CUTOFF = float(os.getenv("LOCATION_FUZZY_CUTOFF", "0.85"))
+MEMO_SIZE = int(os.getenv("LOCATION_MEMO_SIZE", "2048"))
+MIN_PREFIX_LEN = 4  # shorter prefixes ("la", "sf") only count as whole-string matches
+
+@dataclass(frozen=True)
+class CanonicalLocation:
+    id: Optional[str]   # None when the place is not in the gazetteer
+    name: str           # canonical display name of the matched entry (the input on a miss)
+    country: Optional[str] = None
+    match: str = "miss"  # exact | prefix | fuzzy | miss
+    query: str = ""     # what Tavily and weather search for: the canonical name ("NYC" -> "New York"),
+                        # or the user's text when it only matched an area ("Brooklyn" stays "Brooklyn")
+
+def normalize_place(text: str) -> str:
+    """Lowercase, strip accents and punctuation, collapse whitespace"""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    text = re.sub(r"[^a-z0-9]+", " ", text)
+    return text.strip()
+
+class _TrieNode:
+    __slots__ = ("children", "entry_id", "kind")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.entry_id: Optional[str] = None
+        self.kind: Optional[str] = None  # name | alias | area
+
+class Gazetteer:
+    """
+    Offline place index: a character trie over normalised names and aliases for exact and
+    longest-prefix lookups, with difflib fuzzy matching restricted to the subtree sharing
+    the query's first letter. Only the leading comma segment is looked up; the rest of the
+    input ("Portland, Maine") must name the entry's region or country or the lookup misses.
+    """
+
+    def __init__(self):
+        self.root = _TrieNode()
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        # Normalised region / country names that may qualify a place ("fl", "florida", "usa")
+        self.region_names: Dict[str, set] = {}
+        self.country_names: Dict[str, set] = {}
+        self.memo: "OrderedDict[str, CanonicalLocation]" = OrderedDict()
+        self.stats = {"exact": 0, "prefix": 0, "fuzzy": 0, "miss": 0, "memo_hits": 0}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add(self, entry_id: str, name: str, country: Optional[str] = None, aliases: Optional[List[str]] = None,
+            region: Optional[str] = None, areas: Optional[List[str]] = None):
+        """`aliases` are other names for the place itself; `areas` are parts of it (neighbourhoods, islands)"""
+        self.entries.setdefault(entry_id, {"id": entry_id, "name": name, "country": country, "region": region})
+        name_key = normalize_place(name)
+        self._insert(name_key, entry_id, "name")
+        for alias in aliases or []:
+            key = normalize_place(alias)
+            # "new york ny" / "paris france" are the name plus a qualifier, not a different name
+            self._insert(key, entry_id, "name" if key.startswith(name_key + " ") else "alias")
+        for area in areas or []:
+            self._insert(normalize_place(area), entry_id, "area")
+        self.memo.clear()
+
+    def add_alias(self, entry_id: str, alias: str, kind: str = "alias"):
+        self._insert(normalize_place(alias), entry_id, kind)
+        self.memo.clear()
+
+    def add_qualifiers(self, regions: Dict[str, List[str]], countries: Dict[str, List[str]]):
+        for code, names in regions.items():
+            self.region_names.setdefault(code, set()).update(normalize_place(n) for n in names)
+        for code, names in countries.items():
+            self.country_names.setdefault(code, {code.lower()}).update(normalize_place(n) for n in names)
+        self.memo.clear()
+
+    def _insert(self, key: str, entry_id: str, kind: str):
+        if not key:
+            return
+        node = self.root
+        for ch in key:
+            node = node.children.setdefault(ch, _TrieNode())
+        if node.entry_id is None:
+            node.entry_id = entry_id
+            node.kind = kind
+
+    def _node(self, key: str) -> Optional[_TrieNode]:
+        node = self.root
+        for ch in key:
+            node = node.children.get(ch)
+            if node is None:
+                return None
+        return node if node.entry_id else None
+
+    def _longest_prefix(self, key: str) -> Optional[str]:
+        """Longest indexed key that is a whole-word prefix of `key` ("miami beach fl" -> "miami beach")"""
+        node, best = self.root, None
+        for i, ch in enumerate(key):
+            node = node.children.get(ch)
+            if node is None:
+                break
+            if node.entry_id and i + 1 >= MIN_PREFIX_LEN and (i + 1 == len(key) or key[i + 1] == " "):
+                best = key[:i + 1]
+        return best
+
+    def _agrees(self, entry: Dict[str, Any], qualifier: str) -> bool:
+        """True when `qualifier` names the entry's region or country; postcodes are ignored"""
+        qualifier = " ".join(w for w in qualifier.split() if not w.isdigit())
+        if not qualifier:
+            return True
+        return (qualifier in self.region_names.get(entry.get("region"), ())
+                or qualifier in self.country_names.get(entry.get("country"), ()))
+
+    def _keys_under(self, node: _TrieNode, prefix: str) -> List[Tuple[str, str]]:
+        keys, stack = [], [(node, prefix)]
+        while stack:
+            n, p = stack.pop()
+            if n.entry_id:
+                keys.append((p, n.entry_id))
+            stack.extend((child, p + ch) for ch, child in n.children.items())
+        return keys
+
+    def _fuzzy(self, key: str) -> Optional[str]:
+        first = self.root.children.get(key[0])
+        if first is None:
+            return None
+        candidates = dict(self._keys_under(first, key[0]))
+        best = difflib.get_close_matches(key, list(candidates), n=1, cutoff=FUZZY_CUTOFF)
+        return best[0] if best else None
+
+    def _resolve_key(self, key: str) -> Tuple[Optional[str], str]:
+        """Indexed key that `key` resolves to, and how it matched"""
+        if self._node(key):
+            return key, "exact"
+        matched = self._longest_prefix(key)
+        if matched:
+            return matched, "prefix"
+        matched = self._fuzzy(key)
+        if matched:
+            return matched, "fuzzy"
+        return None, "miss"
+
+    def resolve(self, text: str) -> CanonicalLocation:
+        raw = (text or "").strip()
+        segments = [seg for seg in (normalize_place(part) for part in raw.split(",")) if seg]
+        if not segments:
+            return CanonicalLocation(id=None, name=raw, query=raw)
+        cached = self.memo.get(raw)
+        if cached is not None:
+            self.memo.move_to_end(raw)
+            self.stats["memo_hits"] += 1
+            self.stats[cached.match] += 1
+            return cached
+
+        # Only the leading segment names the place; "Rochester, NY" must not resolve through "ny"
+        head, qualifiers = segments[0], segments[1:]
+        matched, match = self._resolve_key(head)
+        node = self._node(matched) if matched else None
+        if node is not None and match == "prefix":
+            qualifiers = [head[len(matched):].strip(), *qualifiers]  # "paris texas" -> "texas"
+        if node is not None and not all(self._agrees(self.entries[node.entry_id], q) for q in qualifiers):
+            node, match = None, "miss"
+
+        if node is None:
+            result = CanonicalLocation(id=None, name=raw, query=raw)
+        else:
+            entry = self.entries[node.entry_id]
+            result = CanonicalLocation(
+                id=entry["id"], name=entry["name"], country=entry.get("country"), match=match,
+                query=raw if node.kind == "area" else entry["name"],
+            )
+        self.stats[result.match] += 1
+        self.memo[raw] = result
+        if len(self.memo) > MEMO_SIZE:
+            self.memo.popitem(last=False)
+        return result
+
+    def find_places(self, words: List[str], max_words: int = 3) -> List[Tuple[int, int, str]]:
+        """Greedy longest-match scan of normalised words; returns (start, end, entry_id) spans"""
+        spans, i = [], 0
+        while i < len(words):
+            for n in range(min(max_words, len(words) - i), 0, -1):
+                node = self._node(" ".join(words[i:i + n]))
+                if node is not None:
+                    # Areas stay as words: "brooklyn" and "manhattan" are both New York but not the same trip
+                    if node.kind != "area":
+                        spans.append((i, i + n, node.entry_id))
+                    i += n
+                    break
+            else:
+                i += 1
+        return spans
+
+    def hit_stats(self) -> Dict[str, Any]:
+        lookups = sum(self.stats[k] for k in ("exact", "prefix", "fuzzy", "miss"))
+        hits = lookups - self.stats["miss"]
+        return {
+            **self.stats,
+            "lookups": lookups,
+            "hit_rate": round(hits / lookups, 4) if lookups else None,
+            "entries": len(self.entries),
+        }
+
+def load_bundled_cities(gazetteer: Gazetteer, path: str = CITIES_PATH, regions_path: str = REGIONS_PATH):
+    with open(path, encoding="utf-8") as f:
+        for city in json.load(f):
+            gazetteer.add(city["id"], city["name"], city.get("country"), city.get("aliases"),
+                          region=city.get("region"), areas=city.get("areas"))
+    with open(regions_path, encoding="utf-8") as f:
+        qualifiers = json.load(f)
+    gazetteer.add_qualifiers(qualifiers["regions"], qualifiers["countries"])
+
+gazetteer = Gazetteer()
+load_bundled_cities(gazetteer)
+
+def canonicalize_location(text: str) -> CanonicalLocation:
+    return gazetteer.resolve(text)
+
+def location_stats() -> Dict[str, Any]:
+    return gazetteer.hit_stats()
+
+async def seed_from_properties() -> int:
+    """Add listing locations from property-service; known places become aliases, unknown ones new entries"""
+    try:
+        response = await get_client("property").get(f"{PROPERTY_SERVICE_URL}/property/api/property/", timeout=10.0)
+        response.raise_for_status()
+        properties = response.json()
+    except Exception as e:
+        print(f"⚠️ Could not seed gazetteer from property service: {e}")
+        return 0
+
+    added = 0
+    for prop in properties if isinstance(properties, list) else []:
+        raw = (prop.get("location") or "").strip()
+        if not raw:
+            continue
+        resolved = gazetteer.resolve(raw)
+        if resolved.id:
+            # A listing in "Brooklyn, NY" is still only part of New York
+            gazetteer.add_alias(resolved.id, raw, "alias" if resolved.query == resolved.name else "area")
+        else:
+            gazetteer.add(f"listing-{normalize_place(raw).replace(' ', '-')}", raw)
+            added += 1
+    print(f"📍 Gazetteer seeded with {added} listing locations ({len(gazetteer)} entries)")
+    return added
+
+def benchmark(iterations: int = 20000) -> Dict[str, float]:
+    """Micro-benchmark: cold (memo cleared) and warm lookup latency in microseconds"""
+    queries = ["NYC", "New York", "new york, ny", "Manhattan", "Miami Beach, FL", "San Fransisco",
+               "paris france", "Barcelonna", "Lisboa", "Springfield"]
+    bench = Gazetteer()
+    load_bundled_cities(bench)
+
+    start = time.perf_counter()
+    for i in range(iterations):
+        bench.memo.clear()
+        bench.resolve(queries[i % len(queries)])
+    cold = (time.perf_counter() - start) / iterations * 1e6
+
+    start = time.perf_counter()
+    for i in range(iterations):
+        bench.resolve(queries[i % len(queries)])
+    warm = (time.perf_counter() - start) / iterations * 1e6
+    return {"cold_us": round(cold, 2), "warm_us": round(warm, 2), "hit_rate": bench.hit_stats()["hit_rate"]}
+
+if __name__ == "__main__":
+    for q in ["NYC", "New York", "new york, ny", "Manhattan", "San Fransisco", "Springfield"]:
+        print(f"{q!r:20} -> {gazetteer.resolve(q)}")
+    print(benchmark())
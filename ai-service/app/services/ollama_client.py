@@ -1,39 +1,75 @@
 import os, json, httpx
+from typing import Optional
+
+from .semantic_cache import trip_cache
+from .http_clients import get_client
+from .deadline import DeadlineExceeded, within_deadline, ITINERARY_RESERVE_SECONDS
 
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 MODEL_NAME = os.getenv("OLLAMA_MODEL", "phi3:mini")  # Using phi3:mini model
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "24h")  # keep the model resident between requests
+
+async def preload_model():
+    """Ask Ollama to load the model into memory; an empty prompt loads it without generating"""
+    client = get_client("ollama")
+    r = await client.post(
+        f"{OLLAMA_BASE_URL}/api/generate",
+        json={"model": MODEL_NAME, "prompt": "", "stream": False, "keep_alive": OLLAMA_KEEP_ALIVE},
+        timeout=httpx.Timeout(300.0, connect=10.0),
+    )
+    r.raise_for_status()
 
-async def extract_trip_json(prompt: str) -> dict:
+async def extract_trip_json(prompt: str, cache_key: Optional[str] = None) -> dict:
     """
     Calls Ollama (phi3:mini) to return STRICT JSON containing:
     location, dates, party_type, budget, interests, dietary_filters
+
+    When `cache_key` (the conversational part of the prompt) is given, paraphrases of an
+    earlier request are answered from the local semantic cache without calling Ollama.
+
+    Inside a request the call is bounded by the remaining deadline, less a reserve for
+    building the itinerary; running out raises DeadlineExceeded.
     """
+    if cache_key:
+        cached = trip_cache.get(cache_key)
+        if cached is not None:
+            print("⚡ Trip extraction served from semantic cache")
+            return cached
     body = {
         "model": MODEL_NAME,
         "prompt": prompt,
-        "stream": False
+        "stream": False,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
     }
     # Increased timeout to 300 seconds (5 minutes) for LLM generation
     timeout = httpx.Timeout(300.0, connect=10.0)
-    async with httpx.AsyncClient(timeout=timeout) as client:
+    client = get_client("ollama")
+    try:
+        r = await within_deadline(
+            client.post(f"{OLLAMA_BASE_URL}/api/generate", json=body, timeout=timeout),
+            cap=300.0, reserve=ITINERARY_RESERVE_SECONDS,
+        )
+        r.raise_for_status()
+        text = r.json().get("response", "").strip()
+        # Some LLMs may wrap JSON in code fences; strip gently
+        if text.startswith("```"):
+            text = text.strip("` \n")
+            if text.startswith("json"):
+                text = text[4:].strip()
         try:
-            r = await client.post(f"{OLLAMA_BASE_URL}/api/generate", json=body)
-            r.raise_for_status()
-            text = r.json().get("response", "").strip()
-            # Some LLMs may wrap JSON in code fences; strip gently
-            if text.startswith("```"):
-                text = text.strip("` \n")
-                if text.startswith("json"):
-                    text = text[4:].strip()
-            try:
-                return json.loads(text)
-            except Exception:
-                return {}
-        except httpx.ConnectError as e:
-            raise Exception(f"Cannot connect to Ollama at {OLLAMA_BASE_URL}. Is Ollama running? Error: {str(e)}")
-        except httpx.ReadTimeout as e:
-            raise Exception(f"Ollama request timed out after 300 seconds. The model might be too slow or the request too complex. Error: {str(e)}")
-        except httpx.HTTPStatusError as e:
-            raise Exception(f"Ollama returned an error status: {e.response.status_code}. Response: {e.response.text}")
-        except Exception as e:
-            raise Exception(f"Error calling Ollama: {str(e)}")
+            parsed = json.loads(text)
+        except Exception:
+            return {}
+        if cache_key and isinstance(parsed, dict) and parsed:
+            trip_cache.put(cache_key, parsed)
+        return parsed
+    except DeadlineExceeded:
+        raise
+    except httpx.ConnectError as e:
+        raise Exception(f"Cannot connect to Ollama at {OLLAMA_BASE_URL}. Is Ollama running? Error: {str(e)}")
+    except httpx.ReadTimeout as e:
+        raise Exception(f"Ollama request timed out after 300 seconds. The model might be too slow or the request too complex. Error: {str(e)}")
+    except httpx.HTTPStatusError as e:
+        raise Exception(f"Ollama returned an error status: {e.response.status_code}. Response: {e.response.text}")
+    except Exception as e:
+        raise Exception(f"Error calling Ollama: {str(e)}")
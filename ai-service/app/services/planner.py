@@ -1,3 +1,5 @@
+import os
+import asyncio
 from typing import List, Dict, Any
 from datetime import datetime, timedelta
 from ..models import (
@@ -6,21 +8,35 @@ from ..models import (
 )
 from .tavily import search_tavily
 from .weather import get_weather_info
+from .locations import canonicalize_location
+from .ranking import dedupe_results, rank_results, party_keywords
+from .deadline import DeadlineExceeded, remaining
+
+ACTIVITY_TOP_K = int(os.getenv("ACTIVITY_TOP_K", "6"))
+RESTAURANT_TOP_K = int(os.getenv("RESTAURANT_TOP_K", "4"))
+
+def _matched_interests(result: Dict[str, Any], interests: List[str]) -> List[str]:
+    text = f"{result.get('title') or ''} {result.get('snippet') or ''}".lower()
+    return [i for i in interests if i and i.lower() in text]
 
 async def get_activities(location: str, party_type: str, preferences: TravelerPreferences) -> List[ActivityCard]:
     q = f"Top activities in {location} for {party_type}"
     results = await search_tavily(q, max_results=10)
-    return [ActivityCard(title=r["title"], address=r["url"], duration="2-3 hours", tags=preferences.interests or []) for r in results]
+    interests = preferences.interests or []
+    # Drop near-duplicate attractions and keep only the best matches for this party
+    results = rank_results(dedupe_results(results), party_keywords(party_type) + interests, ACTIVITY_TOP_K)
+    return [ActivityCard(title=r["title"], address=r["url"], duration="2-3 hours", tags=_matched_interests(r, interests)) for r in results]
 
 async def get_restaurants(location: str, preferences: TravelerPreferences) -> List[RestaurantRecommendation]:
     filt = ", ".join(preferences.dietary_filters) or "best"
     q = f"{filt} restaurants in {location}"
     results = await search_tavily(q, max_results=6)
+    results = rank_results(dedupe_results(results), preferences.dietary_filters or [], RESTAURANT_TOP_K)
     return [RestaurantRecommendation(name=r["title"], address=r["url"], cuisine_type="Various", price_tier="$$", rating=4.2) for r in results]
 
 async def get_local_events(location: str, dates: str) -> List[Dict[str, Any]]:
     q = f"Events happening in {location} during {dates}"
-    results = await search_tavily(q, max_results=5)
+    results = dedupe_results(await search_tavily(q, max_results=5))
     return [{"name": r["title"], "url": r["url"], "description": r["snippet"], "location": location} for r in results]
 
 def packing_list(weather_info, preferences: TravelerPreferences) -> List[PackingItem]:
@@ -35,31 +51,41 @@ def packing_list(weather_info, preferences: TravelerPreferences) -> List[Packing
     return items
 
 async def build_itinerary(location: str, dates: str, party_type: str, preferences: TravelerPreferences) -> ConciergeResponse:
-    # Run weather and Tavily searches in parallel to speed up
-    import asyncio
-    weather = get_weather_info(location, dates)  # This is synchronous but fast
-    activities_task = get_activities(location, party_type, preferences)
-    restaurants_task = get_restaurants(location, preferences)
-    events_task = get_local_events(location, dates)
-    
-    # Wait for all async tasks in parallel
-    activities, restaurants, events = await asyncio.gather(
-        activities_task,
-        restaurants_task,
-        events_task,
-        return_exceptions=True
-    )
-    
-    # Handle exceptions gracefully
-    if isinstance(activities, Exception):
-        print(f"⚠️ Error fetching activities: {activities}")
-        activities = []
-    if isinstance(restaurants, Exception):
-        print(f"⚠️ Error fetching restaurants: {restaurants}")
-        restaurants = []
-    if isinstance(events, Exception):
-        print(f"⚠️ Error fetching events: {events}")
-        events = []
+    location = canonicalize_location(location).query
+    # Weather and Tavily searches run in parallel on the request's remaining budget; sections
+    # still running when it is spent are cancelled, left empty and listed in `missing_sections`
+    sections = {
+        "weather_info": asyncio.create_task(get_weather_info(location, dates)),
+        "activity_cards": asyncio.create_task(get_activities(location, party_type, preferences)),
+        "restaurant_recommendations": asyncio.create_task(get_restaurants(location, preferences)),
+        "local_events": asyncio.create_task(get_local_events(location, dates)),
+    }
+    left = remaining()
+    try:
+        _, pending = await asyncio.wait(sections.values(), timeout=max(left, 0.0) if left is not None else None)
+    finally:
+        for task in sections.values():
+            task.cancel()  # no-op for finished tasks; stops stragglers (or everything, if we were cancelled)
+
+    results: Dict[str, Any] = {}
+    missing: List[str] = []
+    for name, task in sections.items():
+        error = None if task in pending else task.exception()
+        if task in pending or isinstance(error, DeadlineExceeded):
+            print(f"⏱️ Deadline reached before {name} finished")
+            missing.append(name)
+        elif error is not None:
+            # Handle exceptions gracefully
+            print(f"⚠️ Error fetching {name}: {error}")
+        else:
+            results[name] = task.result()
+    if "activity_cards" in missing:
+        missing.append("day_by_day_plan")
+
+    weather = results.get("weather_info") or {"location": location, "forecast": []}
+    activities = results.get("activity_cards") or []
+    restaurants = results.get("restaurant_recommendations") or []
+    events = results.get("local_events") or []
     
     pack = packing_list(weather, preferences)
 
@@ -95,11 +121,11 @@ async def build_itinerary(location: str, dates: str, party_type: str, preference
     day_plans: List[DayPlan] = []
     i = 0
     while current <= end:
-        subset = activities[i:i+3]
-        if len(subset) < 3:
-            subset += activities[:3-len(subset)]
+        # Cycle through the (deduplicated, top-K) cards; with fewer than 3 some slots stay empty
+        subset = [activities[(i + k) % len(activities)] for k in range(min(3, len(activities)))]
         i += 3
-        day_plans.append(DayPlan(date=current.strftime("%Y-%m-%d"), morning=[subset[0]], afternoon=[subset[1]], evening=[subset[2]]))
+        slots = [[card] for card in subset] + [[] for _ in range(3 - len(subset))]
+        day_plans.append(DayPlan(date=current.strftime("%Y-%m-%d"), morning=slots[0], afternoon=slots[1], evening=slots[2]))
         current += timedelta(days=1)
 
     return ConciergeResponse(
@@ -109,4 +135,6 @@ async def build_itinerary(location: str, dates: str, party_type: str, preference
         packing_checklist=pack,
         weather_info=weather,
         local_events=events,
+        partial=bool(missing),
+        missing_sections=missing,
     )
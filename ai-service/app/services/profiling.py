@@ -0,0 +1,122 @@
+import os, io, re, hmac, json, time, uuid, random, asyncio, cProfile, pstats
+from typing import Dict, Any, List, Optional
+
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")  # callers sending X-Profile-Token: <token> get profiled
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/ai-profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.05"))
+PROFILE_PATH_PREFIX = "/ai/chatbot"
+
+# Middleware and the lag monitor are only installed when this is true, so a disabled profiler costs nothing.
+# Sampling needs the token too: without it nobody could list or download the profiles it writes.
+PROFILING_ENABLED = bool(PROFILE_TOKEN)
+if PROFILE_SAMPLE_RATE > 0 and not PROFILE_TOKEN:
+    print("⚠️ PROFILE_SAMPLE_RATE is set but PROFILE_TOKEN is not; profiling stays disabled")
+
+_profile_lock = asyncio.Lock()
+_lag = {"total": 0.0, "max": 0.0}
+_lag_task: Optional[asyncio.Task] = None
+
+async def _loop_lag_monitor():
+    """Sleep a fixed interval and count how late the loop wakes us; lateness is time the loop was blocked"""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + LOOP_LAG_INTERVAL
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        lag = max(0.0, loop.time() - expected)
+        _lag["total"] += lag
+        _lag["max"] = max(_lag["max"], lag)
+
+def start_loop_lag_monitor():
+    global _lag_task
+    if PROFILING_ENABLED and _lag_task is None:
+        _lag_task = asyncio.create_task(_loop_lag_monitor())
+
+async def stop_loop_lag_monitor():
+    global _lag_task
+    if _lag_task is not None:
+        _lag_task.cancel()
+        await asyncio.gather(_lag_task, return_exceptions=True)
+        _lag_task = None
+
+def is_admin(token: Optional[str]) -> bool:
+    return bool(PROFILE_TOKEN) and token is not None and hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode())
+
+def _should_profile(request) -> bool:
+    if not request.url.path.startswith(PROFILE_PATH_PREFIX):
+        return False
+    if is_admin(request.headers.get("x-profile-token")):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+def _write_profile(profiler: cProfile.Profile, meta: Dict[str, Any]) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    slug = re.sub(r"[^a-z0-9]+", "-", meta["path"].lower()).strip("-")
+    name = f"{time.strftime('%Y%m%dT%H%M%S')}-{slug}-{meta['id']}"
+    profiler.dump_stats(os.path.join(PROFILE_DIR, name + ".prof"))
+    with open(os.path.join(PROFILE_DIR, name + ".json"), "w") as f:
+        json.dump(meta, f)
+    # Keep a bounded ring: drop the oldest profiles beyond PROFILE_MAX_FILES
+    for old in list_profiles()[PROFILE_MAX_FILES:]:
+        for ext in (".prof", ".json"):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, old["name"] + ext))
+            except FileNotFoundError:
+                pass
+    return name
+
+async def profile_requests(request, call_next):
+    """
+    HTTP middleware. cProfile hooks the whole thread, so only one request is profiled at a time;
+    others arriving meanwhile run unprofiled rather than waiting.
+    """
+    if not _should_profile(request) or _profile_lock.locked():
+        return await call_next(request)
+    async with _profile_lock:
+        meta: Dict[str, Any] = {"id": uuid.uuid4().hex[:12], "path": request.url.path, "method": request.method}
+        lag_before = _lag["total"]
+        _lag["max"] = 0.0
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            response = await call_next(request)
+        finally:
+            profiler.disable()
+            meta["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            meta["loop_blocked_ms"] = round((_lag["total"] - lag_before) * 1000, 1)
+            meta["max_loop_lag_ms"] = round(_lag["max"] * 1000, 1)
+            meta["created_at"] = time.time()
+            name = await asyncio.to_thread(_write_profile, profiler, meta)
+        response.headers["X-Profile-Id"] = name
+        print(f"🔬 Profiled {meta['path']} in {meta['duration_ms']}ms (loop blocked {meta['loop_blocked_ms']}ms) -> {name}")
+        return response
+
+def list_profiles() -> List[Dict[str, Any]]:
+    """Profile metadata, newest first"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    items = []
+    for fname in os.listdir(PROFILE_DIR):
+        if not fname.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(PROFILE_DIR, fname)) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        meta["name"] = fname[:-5]
+        items.append(meta)
+    return sorted(items, key=lambda m: m.get("created_at", 0), reverse=True)
+
+def profile_path(name: str) -> Optional[str]:
+    if not re.fullmatch(r"[A-Za-z0-9-]+", name or ""):
+        return None
+    path = os.path.join(PROFILE_DIR, name + ".prof")
+    return path if os.path.isfile(path) else None
+
+def profile_summary(path: str, limit: int = 40) -> str:
+    out = io.StringIO()
+    pstats.Stats(path, stream=out).sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
@@ -0,0 +1,99 @@
+import os, re, zlib
+import numpy as np
+from typing import List, Dict, Any, Iterable
+from urllib.parse import urlsplit
+
+NUM_PERM = 64
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.6"))
+SCORE_DIM = 1 << 12
+_MERSENNE = (1 << 61) - 1
+
+# Fixed seed so signatures are comparable across requests and processes
+_rng = np.random.RandomState(7)
+_PERM_A = _rng.randint(1, 1 << 31, size=NUM_PERM, dtype=np.int64)
+_PERM_B = _rng.randint(0, 1 << 31, size=NUM_PERM, dtype=np.int64)
+
+PARTY_KEYWORDS = {
+    "family": ["family", "kids", "children", "child", "zoo", "aquarium", "park", "museum", "beach"],
+    "couple": ["romantic", "couples", "sunset", "wine", "dinner", "spa", "cruise", "view"],
+    "friends": ["nightlife", "bar", "bars", "club", "brewery", "tour", "festival", "adventure"],
+    "solo": ["walking", "tour", "museum", "cafe", "market", "hike"],
+    "business": ["downtown", "quick", "dinner", "cafe", "landmark"],
+}
+
+def _words(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9]+", (text or "").lower())
+
+def canonical_url(url: str) -> str:
+    """Host without www plus path without trailing slash; scheme, query and fragment are dropped"""
+    if not url:
+        return ""
+    parts = urlsplit(url.lower())
+    host = parts.netloc[4:] if parts.netloc.startswith("www.") else parts.netloc
+    return host + parts.path.rstrip("/")
+
+def _shingles(result: Dict[str, Any]) -> List[int]:
+    """Character 4-grams of the title plus URL path tokens, hashed to 31-bit ints"""
+    title = " ".join(_words(result.get("title")))
+    grams = {title[i:i + 4] for i in range(max(len(title) - 3, 1))}
+    grams.update("url:" + w for w in _words(urlsplit(result.get("url") or "").path))
+    # 31 bits keeps a * x + b inside int64 in minhash_signature
+    return [zlib.crc32(g.encode()) & 0x7FFFFFFF for g in grams if g]
+
+def minhash_signature(shingles: List[int]) -> np.ndarray:
+    if not shingles:
+        return np.full(NUM_PERM, _MERSENNE, dtype=np.int64)
+    x = np.asarray(shingles, dtype=np.int64)[:, None]
+    return ((x * _PERM_A + _PERM_B) % _MERSENNE).min(axis=0)
+
+def dedupe_results(results: List[Dict[str, Any]], threshold: float = DEDUP_THRESHOLD) -> List[Dict[str, Any]]:
+    """
+    Drop near-duplicate search hits, keeping the first (highest ranked) occurrence.
+    Two hits are duplicates when their canonical URLs match or the estimated Jaccard
+    similarity of their MinHash signatures reaches `threshold`.
+    """
+    kept: List[Dict[str, Any]] = []
+    seen_urls = set()
+    signatures: List[np.ndarray] = []
+    for r in results:
+        url = canonical_url(r.get("url"))
+        if url and url in seen_urls:
+            continue
+        sig = minhash_signature(_shingles(r))
+        if signatures and (np.stack(signatures) == sig).mean(axis=1).max() >= threshold:
+            continue
+        kept.append(r)
+        signatures.append(sig)
+        if url:
+            seen_urls.add(url)
+    return kept
+
+def _hashed_vectors(texts: Iterable[str]) -> np.ndarray:
+    texts = list(texts)
+    matrix = np.zeros((len(texts), SCORE_DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for w in _words(text):
+            matrix[row, zlib.crc32(w.encode()) % SCORE_DIM] += 1.0
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-9)
+
+def rank_results(results: List[Dict[str, Any]], keywords: List[str], top_k: int) -> List[Dict[str, Any]]:
+    """
+    Score every candidate against the keyword profile in one matrix product and keep the top K.
+    The search engine's own order is kept as a small prior so ties fall back to relevance.
+    """
+    if not results:
+        return []
+    profile_terms = " ".join(keywords)
+    if not _words(profile_terms):
+        return results[:top_k]
+    docs = _hashed_vectors(f"{r.get('title') or ''} {r.get('snippet') or ''}" for r in results)
+    profile = _hashed_vectors([profile_terms])[0]
+    prior = 0.1 / (1.0 + np.arange(len(results), dtype=np.float32))
+    scores = docs @ profile + prior
+    order = np.argsort(-scores, kind="stable")[:top_k]
+    return [results[i] for i in order]
+
+def party_keywords(party_type: str) -> List[str]:
+    party = (party_type or "").lower()
+    return [w for key, words in PARTY_KEYWORDS.items() if key in party for w in words]
@@ -0,0 +1,141 @@
+import os, re, copy, zlib
+import numpy as np
+from datetime import date
+from typing import Dict, Any, Optional, Tuple
+
+from .locations import gazetteer
+
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "512"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.88"))
+SEMANTIC_CACHE_DIM = int(os.getenv("SEMANTIC_CACHE_DIM", "4096"))
+NGRAM_SIZES = (3, 4)
+
+WEEKDAYS = r"monday|tuesday|wednesday|thursday|friday|saturday|sunday"
+# Whole relative-date phrases ("next week", "this weekend", "in 3 weeks"), so phrases that share
+# a word but not a meaning never look alike to the cache guard
+RELATIVE_DATE_RE = re.compile(
+    r"\b((?:next|this|coming|upcoming)(?: (?:day|week|weekend|month|year|" + WEEKDAYS + r"))?|"
+    r"in (?:\d+|a|an|one|two|three|four|five|six) (?:days?|weeks?|months?|years?)|"
+    r"today|tonight|tomorrow|yesterday|weekend|soon|" + WEEKDAYS + r")\b"
+)
+
+# Filler that changes between paraphrases but never changes the extracted trip
+STOPWORDS = {
+    "a", "an", "the", "to", "in", "for", "of", "on", "at", "and", "or", "with", "from", "by", "me",
+    "my", "i", "we", "our", "us", "you", "your", "is", "are", "be", "it", "im", "am", "please", "can",
+    "could", "would", "like", "want", "wanna", "need", "help", "plan", "planning", "trip", "travel",
+    "traveling", "travelling", "vacation", "holiday", "visit", "visiting", "go", "going", "get", "make",
+    "some", "itinerary", "hi", "hello", "hey", "thanks", "thank", "user", "assistant",
+}
+
+# Wording that may vary between paraphrases; any other token (places, months, numbers, interests)
+# must appear in both texts for a cache hit
+COMMON_WORDS = STOPWORDS | {
+    "days", "day", "nights", "night", "week", "weeks", "weekend", "month", "next", "this", "coming",
+    "upcoming", "soon", "getaway", "stay", "staying", "spend", "spending", "around", "about", "during",
+    "recent", "booking", "location", "dates", "built", "here", "s", "personalized", "what", "where",
+    "when", "how", "do", "should", "there", "that", "things", "ideas", "suggestions", "recommend",
+    "something", "fun", "good", "great", "nice", "best", "top", "yes", "ok", "okay", "sure",
+}
+
+def _tokens(text: str) -> Tuple[list, set]:
+    """Lowercase words with known places folded into their gazetteer id ("nyc" == "new york")"""
+    words = re.findall(r"[a-z0-9]+", (text or "").lower())
+    tokens, places, i = [], set(), 0
+    for start, end, entry_id in gazetteer.find_places(words):
+        tokens.extend(words[i:start])
+        tokens.append(entry_id)
+        places.add(entry_id)
+        i = end
+    tokens.extend(words[i:])
+    return tokens, places
+
+def embed(text: str, dim: int = SEMANTIC_CACHE_DIM) -> np.ndarray:
+    """L2-normalised bag of hashed character n-grams over sorted content words (order insensitive)"""
+    tokens, _ = _tokens(text)
+    padded = " " + " ".join(sorted(w for w in tokens if w not in STOPWORDS)) + " "
+    vec = np.zeros(dim, dtype=np.float32)
+    for n in NGRAM_SIZES:
+        for i in range(len(padded) - n + 1):
+            vec[zlib.crc32(padded[i:i + n].encode()) % dim] += 1.0
+    length = np.linalg.norm(vec)
+    return vec / length if length else vec
+
+def guard_signature(text: str) -> Tuple:
+    """
+    Facts two paraphrases must agree on exactly before a hit is allowed: known places (so "nyc"
+    and "new york" agree), every uncommon token such as numbers, months and interests, and the
+    relative date phrases used ("next week" != "next month"). Relative wording also pins the
+    entry to today's date, because "next week" extracts to different dates on different days.
+    """
+    tokens, places = _tokens(text)
+    facts = {w for w in tokens if w not in COMMON_WORDS and w not in places}
+    relative = frozenset(m.group(0) for m in RELATIVE_DATE_RE.finditer(" ".join(tokens)))
+    relative_day = date.today().isoformat() if relative else None
+    return frozenset(places), frozenset(facts), relative, relative_day
+
+class SemanticCache:
+    """
+    Fixed-capacity nearest-neighbour cache. Vectors live in one preallocated float32 matrix so a
+    lookup is a single matrix-vector product; the least recently used row is overwritten when full.
+    """
+
+    def __init__(self, capacity: int = SEMANTIC_CACHE_SIZE, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 dim: int = SEMANTIC_CACHE_DIM):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.dim = dim
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.last_used = np.zeros(capacity, dtype=np.int64)
+        self.guards: list = [None] * capacity
+        self.values: list = [None] * capacity
+        self.size = 0
+        self.clock = 0
+        self.stats = {"hits": 0, "misses": 0, "guard_rejects": 0, "evictions": 0}
+
+    def get(self, text: str) -> Optional[Dict[str, Any]]:
+        if self.size == 0:
+            self.stats["misses"] += 1
+            return None
+        vec = embed(text, self.dim)
+        sims = self.vectors[:self.size] @ vec
+        guard = guard_signature(text)
+        # Walk candidates above the threshold from most similar down until one passes the guard
+        for row in np.argsort(-sims):
+            if sims[row] < self.threshold:
+                break
+            if self.guards[row] != guard:
+                self.stats["guard_rejects"] += 1
+                continue
+            self.clock += 1
+            self.last_used[row] = self.clock
+            self.stats["hits"] += 1
+            return copy.deepcopy(self.values[row])
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, text: str, value: Dict[str, Any]):
+        if self.size < self.capacity:
+            row = self.size
+            self.size += 1
+        else:
+            row = int(np.argmin(self.last_used))
+            self.stats["evictions"] += 1
+        self.clock += 1
+        self.vectors[row] = embed(text, self.dim)
+        self.last_used[row] = self.clock
+        self.guards[row] = guard_signature(text)
+        self.values[row] = copy.deepcopy(value)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": self.size,
+            "capacity": self.capacity,
+            "threshold": self.threshold,
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else None,
+            "memory_bytes": int(self.vectors.nbytes),
+        }
+
+trip_cache = SemanticCache()
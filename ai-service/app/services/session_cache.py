@@ -0,0 +1,164 @@
+import os, sys, copy, json, time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+SESSION_CACHE_MAX_ENTRIES = int(os.getenv("SESSION_CACHE_MAX_ENTRIES", "2000"))
+SESSION_CACHE_MAX_BYTES = int(os.getenv("SESSION_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "300"))
+SESSION_TAIL = int(os.getenv("SESSION_TAIL", "20"))
+
+_RECORD_OVERHEAD = 200  # slotted object + small field strings, roughly
+
+class MessageRecord:
+    """Compact message kept in the session cache; embedded itineraries are never held here"""
+    __slots__ = ("id", "role", "content", "timestamp", "itinerary_ref")
+
+    def __init__(self, id, role, content, timestamp, itinerary_ref):
+        self.id = id
+        self.role = role
+        self.content = content
+        self.timestamp = timestamp
+        self.itinerary_ref = itinerary_ref
+
+    @classmethod
+    def from_message(cls, m: Dict[str, Any]) -> "MessageRecord":
+        return cls(m.get("id"), m.get("role"), m.get("content") or "", m.get("timestamp"), m.get("itinerary_ref"))
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = {"id": self.id, "role": self.role, "content": self.content, "timestamp": self.timestamp}
+        if self.itinerary_ref:
+            d["itinerary_ref"] = self.itinerary_ref
+        return d
+
+    def nbytes(self) -> int:
+        return _RECORD_OVERHEAD + sys.getsizeof(self.content)
+
+class SessionEntry:
+    __slots__ = ("state", "tail", "nbytes", "expires_at")
+
+    def __init__(self, state: Optional[Dict[str, Any]], tail: List[MessageRecord]):
+        self.state = state
+        self.tail = tail
+        self.expires_at = time.monotonic() + SESSION_CACHE_TTL
+        self.resize()
+
+    def resize(self):
+        state_bytes = len(json.dumps(self.state, default=str)) if self.state else 0
+        self.nbytes = _RECORD_OVERHEAD + state_bytes + sum(r.nbytes() for r in self.tail)
+
+class SessionCache:
+    """
+    Write-through LRU of active conversations (rolling state + last SESSION_TAIL messages) keyed
+    by traveler id, bounded by entry count and estimated bytes. Entries expire after
+    SESSION_CACHE_TTL so a turn served by another pod is picked up within that window.
+    """
+
+    def __init__(self):
+        self.entries: "OrderedDict[str, SessionEntry]" = OrderedDict()
+        self.nbytes = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        # Travelers with a Mongo load in flight -> writes made meanwhile, replayed onto the loaded entry
+        self._loading: Dict[str, Dict[str, Any]] = {}
+
+    def get(self, traveler_id: str) -> Optional[SessionEntry]:
+        entry = self.entries.get(traveler_id)
+        if entry is not None and entry.expires_at < time.monotonic():
+            self._drop(traveler_id)
+            entry = None
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        self.entries.move_to_end(traveler_id)
+        self.stats["hits"] += 1
+        return entry
+
+    def begin_load(self, traveler_id: str):
+        pending = self._loading.setdefault(traveler_id, {"loads": 0, "messages": [], "state": None, "cleared": False})
+        pending["loads"] += 1
+
+    def _end_load(self, traveler_id: str) -> Optional[Dict[str, Any]]:
+        pending = self._loading.get(traveler_id)
+        if pending is None:
+            return None
+        pending["loads"] -= 1
+        if pending["loads"] <= 0:
+            del self._loading[traveler_id]
+        return pending
+
+    def abort_load(self, traveler_id: str):
+        self._end_load(traveler_id)
+
+    def finish_load(self, traveler_id: str, state: Optional[Dict[str, Any]], messages: List[Dict[str, Any]]):
+        """
+        Cache a fresh Mongo read. Writes that landed while it was in flight may or may not be in
+        the read, so they are replayed on top of it: messages by id, state by the latest write.
+        """
+        pending = self._end_load(traveler_id) or {"messages": [], "state": None, "cleared": False}
+        if pending["cleared"]:
+            return
+        tail = [MessageRecord.from_message(m) for m in messages]
+        seen = {r.id for r in tail if r.id}
+        tail += [MessageRecord.from_message(m) for m in pending["messages"] if m.get("id") not in seen]
+        if pending["state"] is not None:
+            state = pending["state"]
+        self._drop(traveler_id)
+        entry = SessionEntry(copy.deepcopy(state), tail[-SESSION_TAIL:])
+        self.entries[traveler_id] = entry
+        self.nbytes += entry.nbytes
+        self._evict()
+
+    def append_message(self, traveler_id: str, message: Dict[str, Any]):
+        pending = self._loading.get(traveler_id)
+        if pending is not None:
+            pending["messages"].append(message)
+        entry = self.entries.get(traveler_id)
+        if entry is None:
+            return
+        self.nbytes -= entry.nbytes
+        entry.tail.append(MessageRecord.from_message(message))
+        del entry.tail[:-SESSION_TAIL]
+        entry.resize()
+        self.nbytes += entry.nbytes
+        self._evict()
+
+    def set_state(self, traveler_id: str, state: Dict[str, Any]):
+        pending = self._loading.get(traveler_id)
+        if pending is not None:
+            pending["state"] = copy.deepcopy(state)
+        entry = self.entries.get(traveler_id)
+        if entry is None:
+            return
+        self.nbytes -= entry.nbytes
+        entry.state = copy.deepcopy(state)
+        entry.resize()
+        self.nbytes += entry.nbytes
+        self._evict()
+
+    def invalidate(self, traveler_id: str):
+        pending = self._loading.get(traveler_id)
+        if pending is not None:
+            pending["cleared"] = True  # the read may predate the delete; do not cache it
+        self._drop(traveler_id)
+
+    def _drop(self, traveler_id: str):
+        entry = self.entries.pop(traveler_id, None)
+        if entry is not None:
+            self.nbytes -= entry.nbytes
+
+    def _evict(self):
+        while self.entries and (len(self.entries) > SESSION_CACHE_MAX_ENTRIES or self.nbytes > SESSION_CACHE_MAX_BYTES):
+            _, entry = self.entries.popitem(last=False)
+            self.nbytes -= entry.nbytes
+            self.stats["evictions"] += 1
+
+    def cache_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self.entries),
+            "bytes": self.nbytes,
+            "max_bytes": SESSION_CACHE_MAX_BYTES,
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else None,
+        }
+
+session_cache = SessionCache()
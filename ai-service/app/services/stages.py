@@ -0,0 +1,105 @@
+import time, asyncio
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Callable, Awaitable, List, Optional
+
+# Per-request timing report; the route puts a dict here and StageGraph.run() fills it in.
+# Tasks copy the context, so stages running in other tasks still write to the same dict.
+request_timings: ContextVar[Optional[Dict[str, Any]]] = ContextVar("request_timings", default=None)
+
+StageFn = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+# Name of the stage running in the current task, so wait() knows who is waiting
+_current_stage: ContextVar[Optional[str]] = ContextVar("current_stage", default=None)
+
+class StageGraph:
+    """
+    Small dependency graph of async stages. Every stage starts as soon as its dependencies
+    finish, independent stages run concurrently, and run() reports per-stage timings and the
+    critical path (the dependency chain that decided total latency).
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, tuple] = {}
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.spans: Dict[str, tuple] = {}
+        # Dependencies discovered at run time through wait(), so critical_path() can follow them too
+        self.dynamic_deps: Dict[str, List[str]] = {}
+        self.origin = 0.0
+
+    def add(self, name: str, fn: StageFn, deps: Optional[List[str]] = None):
+        """`fn` receives a dict with the results of its dependencies"""
+        self.stages[name] = (fn, [d for d in (deps or [])])
+
+    async def wait(self, name: str) -> Any:
+        """Await another stage from inside a stage (for dependencies only known at run time)"""
+        waiter = _current_stage.get()
+        if waiter is not None and waiter != name:
+            self.dynamic_deps.setdefault(waiter, []).append(name)
+        return await asyncio.shield(self.tasks[name])
+
+    async def _run_stage(self, name: str) -> Any:
+        fn, deps = self.stages[name]
+        inputs = {d: await asyncio.shield(self.tasks[d]) for d in deps if d in self.tasks}
+        _current_stage.set(name)  # each stage runs in its own task, so this only affects that task
+        start = time.perf_counter()
+        try:
+            return await fn(inputs)
+        finally:
+            self.spans[name] = (start - self.origin, time.perf_counter() - self.origin)
+
+    def deps_of(self, name: str) -> List[str]:
+        return self.stages[name][1] + self.dynamic_deps.get(name, [])
+
+    async def run(self) -> Dict[str, Any]:
+        self.origin = time.perf_counter()
+        for name in self.stages:
+            self.tasks[name] = asyncio.create_task(self._run_stage(name))
+        try:
+            results = await asyncio.gather(*self.tasks.values())
+        except BaseException:
+            for task in self.tasks.values():
+                task.cancel()
+            raise
+        self._report()
+        return dict(zip(self.tasks.keys(), results))
+
+    def critical_path(self) -> List[str]:
+        """Walk back from the last stage to finish through whichever dependency finished last"""
+        if not self.spans:
+            return []
+        path = [max(self.spans, key=lambda n: self.spans[n][1])]
+        while True:
+            deps = [d for d in self.deps_of(path[-1]) if d in self.spans]
+            if not deps:
+                return list(reversed(path))
+            path.append(max(deps, key=lambda d: self.spans[d][1]))
+
+    def _report(self):
+        timings = {name: round((end - start) * 1000, 1) for name, (start, end) in self.spans.items()}
+        path = self.critical_path()
+        total = round(max(end for _, end in self.spans.values()) * 1000, 1) if self.spans else 0.0
+        print(f"⏱️ Stages {timings} | critical path {' -> '.join(path)} ({total}ms)")
+        report = request_timings.get()
+        if report is not None:
+            report.setdefault("stages", {}).update(timings)
+            report["critical_path"] = path
+            report["critical_path_ms"] = total
+
+@asynccontextmanager
+async def timed_stage(name: str):
+    """Time a sequential stage that runs after the graph (model call, itinerary build)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        report = request_timings.get()
+        if report is not None:
+            report.setdefault("stages", {})[name] = round((time.perf_counter() - start) * 1000, 1)
+
+def server_timing_header(report: Dict[str, Any]) -> str:
+    """Render a timings report as a Server-Timing header value"""
+    parts = [f"{name};dur={ms}" for name, ms in report.get("stages", {}).items()]
+    if "critical_path_ms" in report:
+        parts.append(f"critical-path;dur={report['critical_path_ms']};desc=\"{'>'.join(report['critical_path'])}\"")
+    return ", ".join(parts)
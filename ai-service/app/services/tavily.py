@@ -1,16 +1,21 @@
-import os, httpx
+import os
 from typing import List, Dict, Any
 
+from .http_clients import get_client
+from .deadline import within_deadline
+
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
+TAVILY_URL = "https://api.tavily.com/search"
 
 async def search_tavily(query: str, max_results: int = 5) -> List[Dict[str, Any]]:
     if not TAVILY_API_KEY:
         return []
     payload = {"api_key": TAVILY_API_KEY, "query": query, "max_results": max_results}
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        r = await client.post("https://api.tavily.com/search", json=payload)
-        r.raise_for_status()
-        data = r.json()
+    client = get_client("tavily")
+    # httpx bounds each read; within_deadline bounds the whole call by the request's remaining budget
+    r = await within_deadline(client.post(TAVILY_URL, json=payload, timeout=60.0), cap=60.0)
+    r.raise_for_status()
+    data = r.json()
     return [
         {"title": r.get("title"), "url": r.get("url"), "snippet": r.get("content")}
         for r in data.get("results", [])
@@ -0,0 +1,72 @@
+import os, asyncio
+from datetime import datetime
+from typing import Dict, Any, Callable, Awaitable, Optional
+
+from .db import client as mongo_client, prime_mongo, ensure_indexes
+from .jobs import ensure_job_indexes
+from .idempotency import ensure_idempotency_indexes
+from .ollama_client import preload_model
+from .tavily import TAVILY_API_KEY, TAVILY_URL
+from .http_clients import get_client
+from .locations import PROPERTY_SERVICE_URL, seed_from_properties
+
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "5"))
+PRELOAD_MODEL = os.getenv("PRELOAD_MODEL", "true").lower() == "true"
+
+# Step name -> "pending" | "ok" | "skipped" | "error: ..."
+state: Dict[str, Any] = {"started_at": None, "ready_at": None, "checks": {}}
+
+async def _open_pool(name: str, url: str):
+    # Any response (even 404) means a pooled keep-alive connection now exists
+    await get_client(name).get(url, timeout=10.0)
+
+async def _until_ok(step: str, fn: Callable[[], Awaitable[Any]], required: bool = True):
+    """Run a warm-up step, retrying required ones until they succeed"""
+    while True:
+        try:
+            await fn()
+            state["checks"][step] = "ok"
+            return
+        except Exception as e:
+            state["checks"][step] = f"error: {e}"
+            print(f"⚠️ Warm-up step '{step}' failed: {e}")
+            if not required:
+                return
+            await asyncio.sleep(WARMUP_RETRY_SECONDS)
+
+async def warm_up(pools: Optional[Dict[str, str]] = None):
+    """
+    Preload the model, prime Mongo and indexes, and open upstream HTTP pools in parallel.
+    `pools` maps extra client names to a URL to connect to (e.g. the booking service).
+    """
+    state["started_at"] = datetime.utcnow()
+    steps = []
+    if mongo_client is not None:
+        steps.append(_until_ok("mongo", prime_mongo))
+        steps.append(_until_ok("indexes", lambda: asyncio.gather(
+            ensure_indexes(), ensure_job_indexes(), ensure_idempotency_indexes()
+        )))
+    else:
+        state["checks"]["mongo"] = state["checks"]["indexes"] = "skipped"
+    if PRELOAD_MODEL:
+        steps.append(_until_ok("model", preload_model))
+    else:
+        state["checks"]["model"] = "skipped"
+    # Upstream pools and the gazetteer only speed things up, so they never block readiness
+    pools = {**(pools or {}), "property": PROPERTY_SERVICE_URL}
+    if TAVILY_API_KEY:
+        pools["tavily"] = TAVILY_URL
+    for name, url in pools.items():
+        steps.append(_until_ok(f"pool:{name}", lambda name=name, url=url: _open_pool(name, url), required=False))
+    steps.append(_until_ok("gazetteer", seed_from_properties, required=False))
+    for name in ("mongo", "indexes", "model"):
+        state["checks"].setdefault(name, "pending")
+    await asyncio.gather(*steps)
+    state["ready_at"] = datetime.utcnow()
+    print(f"✅ Warm-up finished in {(state['ready_at'] - state['started_at']).total_seconds():.1f}s: {state['checks']}")
+
+def is_ready() -> bool:
+    return state["ready_at"] is not None
+
+def readiness() -> Dict[str, Any]:
+    return {"status": "ready" if is_ready() else "warming_up", **state}
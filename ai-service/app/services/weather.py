@@ -1,10 +1,14 @@
-import os, requests
+import os
 from datetime import datetime
 from typing import Dict, Any, List
 
+from .http_clients import get_client
+from .deadline import DeadlineExceeded, within_deadline
+
 OPEN_WEATHER_API_KEY = os.getenv("OPEN_WEATHER_API_KEY")
+OPEN_WEATHER_URL = "https://api.openweathermap.org/data/2.5/forecast"
 
-def get_weather_info(location: str, dates: str) -> Dict[str, Any]:
+async def get_weather_info(location: str, dates: str) -> Dict[str, Any]:
     if not OPEN_WEATHER_API_KEY:
         return {"location": location, "forecast": []}
 
@@ -12,9 +16,10 @@ def get_weather_info(location: str, dates: str) -> Dict[str, Any]:
         start_str, end_str = dates.split(" to ")
         start_date = datetime.strptime(start_str, "%Y-%m-%d").date()
 
-        url = "https://api.openweathermap.org/data/2.5/forecast"
         params = {"q": location, "appid": OPEN_WEATHER_API_KEY, "units": "metric"}
-        data = requests.get(url, params=params, timeout=15).json()
+        client = get_client("weather")
+        r = await within_deadline(client.get(OPEN_WEATHER_URL, params=params, timeout=15.0), cap=15.0)
+        data = r.json()
 
         forecast: List[Dict[str, Any]] = []
         for i in range(0, len(data.get("list", [])), 8):
@@ -25,5 +30,7 @@ def get_weather_info(location: str, dates: str) -> Dict[str, Any]:
                 "condition": entry["weather"][0]["description"].title()
             })
         return {"location": location, "forecast": forecast[:5]}
+    except DeadlineExceeded:
+        raise
     except Exception:
         return {"location": location, "forecast": []}
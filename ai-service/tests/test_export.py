@@ -0,0 +1,23 @@
+from bson import ObjectId
+
+from app.services.export import _flatten, _pipeline, parse_checkpoint
+
+CONV = ObjectId("65f000000000000000000001")
+
+def doc():
+    card = {"title": "Museum", "tags": ["art"]}
+    day = {"date": "2026-11-01", "morning": [card], "afternoon": [card], "evening": []}
+    return {"_id": CONV, "message_index": 4, "traveler_id": "t1",
+            "messages": {"id": "m4", "itinerary": {"day_by_day_plan": [day, day]}}}
+
+def test_multi_row_tables_checkpoint_every_row():
+    rows = _flatten(doc(), "activities")
+    assert [r["checkpoint"] for r in rows] == [f"{CONV}:4:{n}" for n in range(4)]
+
+def test_message_checkpoints_keep_two_parts():
+    assert parse_checkpoint(f"{CONV}:4") == (CONV, 4, None)
+    assert parse_checkpoint(f"{CONV}:4:2") == (CONV, 4, 2)
+
+def test_row_checkpoint_rereads_its_message():
+    stage = _pipeline(None, None, (CONV, 4, 2), True)[4]["$match"]["$or"][1]
+    assert stage == {"message_index": {"$gte": 4}}
@@ -0,0 +1,67 @@
+import pytest
+
+from app.services.locations import Gazetteer, load_bundled_cities
+
+@pytest.fixture(scope="module")
+def gazetteer():
+    g = Gazetteer()
+    load_bundled_cities(g)
+    return g
+
+@pytest.mark.parametrize("text", [
+    "Rochester, NY",
+    "Buffalo, NY",
+    "Portland, Maine",
+    "Paris, Texas",
+    "paris texas",
+    "San Jose, Costa Rica",
+    "London, Ontario",
+])
+def test_qualifier_that_disagrees_falls_back_to_raw_text(gazetteer, text):
+    resolved = gazetteer.resolve(text)
+    assert resolved.id is None
+    assert resolved.match == "miss"
+    assert resolved.query == text
+
+@pytest.mark.parametrize("text, entry_id, query", [
+    ("Portland, OR", "us-portland", "Portland"),
+    ("Paris, France", "fr-paris", "Paris"),
+    ("San Jose, CA", "us-san-jose", "San Jose"),
+    ("London, UK", "gb-london", "London"),
+    ("new york, ny", "us-new-york", "New York"),
+    ("Miami, Florida, USA", "us-miami", "Miami"),
+    ("San Fransisco", "us-san-francisco", "San Francisco"),
+])
+def test_agreeing_qualifiers_resolve_to_canonical_name(gazetteer, text, entry_id, query):
+    resolved = gazetteer.resolve(text)
+    assert resolved.id == entry_id
+    assert resolved.query == query
+
+@pytest.mark.parametrize("text, entry_id", [
+    ("Brooklyn", "us-new-york"),
+    ("Santa Monica", "us-los-angeles"),
+    ("Miami Beach", "us-miami"),
+    ("Miami Beach, FL 33139", "us-miami"),
+])
+def test_area_matches_keep_the_users_text_for_search(gazetteer, text, entry_id):
+    resolved = gazetteer.resolve(text)
+    assert resolved.id == entry_id
+    assert resolved.query == text
+
+@pytest.mark.parametrize("text, entry_id, query", [
+    ("NYC", "us-new-york", "New York"),
+    ("the big apple", "us-new-york", "New York"),
+    ("LA", "us-los-angeles", "Los Angeles"),
+    ("Washington, DC", "us-washington-dc", "Washington, D.C."),
+])
+def test_alias_matches_search_for_the_canonical_name(gazetteer, text, entry_id, query):
+    resolved = gazetteer.resolve(text)
+    assert resolved.id == entry_id
+    assert resolved.query == query
+
+def test_qualifier_alone_never_matches(gazetteer):
+    assert gazetteer.resolve("Springfield, NY").id is None
+
+def test_areas_are_not_folded_into_their_city(gazetteer):
+    words = "weekend in brooklyn or nyc".split()
+    assert [(s, e) for s, e, _ in gazetteer.find_places(words)] == [(4, 5)]
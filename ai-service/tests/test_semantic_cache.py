@@ -0,0 +1,30 @@
+import pytest
+
+from app.services.conversation_state import empty_state, render_state
+from app.services.semantic_cache import SemanticCache
+
+def cache_key(message: str) -> str:
+    """Same shape as the key process_chat builds for a new conversation without a booking"""
+    return f"\n{render_state(empty_state())}\n{message}"
+
+STORED = "couple trip to Miami for 3 days next week"
+NEXT_WEEK_TRIP = {"location": "Miami", "dates": "2026-10-26 to 2026-10-29"}
+
+@pytest.fixture
+def cache():
+    c = SemanticCache(capacity=8)
+    c.put(cache_key(STORED), NEXT_WEEK_TRIP)
+    return c
+
+@pytest.mark.parametrize("message", [
+    "couple trip to Miami for 3 days next month",
+    "couple trip to Miami for 3 days next weekend",
+    "couple trip to Miami for 3 days this weekend",
+    "couple trip to Miami for 3 days in 2 weeks",
+    "couple trip to Miami for 3 days next friday",
+])
+def test_different_relative_dates_do_not_hit(cache, message):
+    assert cache.get(cache_key(message)) is None
+
+def test_same_relative_date_paraphrase_hits(cache):
+    assert cache.get(cache_key("trip to miami next week for 3 days, couple")) == NEXT_WEEK_TRIP
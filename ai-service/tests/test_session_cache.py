@@ -0,0 +1,57 @@
+import asyncio
+
+from app.services.session_cache import SessionCache
+
+def message(n):
+    return {"id": f"m{n}", "role": "user", "content": f"message {n}"}
+
+def test_write_racing_a_load_is_merged_not_dropped():
+    cache = SessionCache()
+    cache.begin_load("t")
+    cache.append_message("t", message(2))          # save lands while the read is in flight
+    cache.finish_load("t", {"turns": 1}, [message(1)])
+    entry = cache.get("t")
+    assert [r.id for r in entry.tail] == ["m1", "m2"]
+
+def test_write_already_in_the_read_is_not_duplicated():
+    cache = SessionCache()
+    cache.begin_load("t")
+    cache.append_message("t", message(2))
+    cache.set_state("t", {"turns": 2})
+    cache.finish_load("t", {"turns": 1}, [message(1), message(2)])
+    entry = cache.get("t")
+    assert [r.id for r in entry.tail] == ["m1", "m2"]
+    assert entry.state == {"turns": 2}
+
+def test_clear_during_load_is_not_cached():
+    cache = SessionCache()
+    cache.begin_load("t")
+    cache.invalidate("t")
+    cache.finish_load("t", None, [message(1)])
+    assert cache.get("t") is None
+
+def test_concurrent_save_and_load_fill_the_cache_across_turns():
+    """The chat path saves the user message and loads state concurrently on every turn"""
+    cache = SessionCache()
+    stored = []
+
+    async def save(n):
+        await asyncio.sleep(0.001)
+        stored.append(message(n))
+        cache.append_message("t", message(n))
+
+    async def load():
+        if cache.get("t") is not None:
+            return
+        cache.begin_load("t")
+        snapshot = list(stored)
+        await asyncio.sleep(0.001)
+        cache.finish_load("t", None, snapshot)
+
+    async def turns():
+        for n in range(10):
+            await asyncio.gather(save(n), load())
+
+    asyncio.run(turns())
+    assert cache.stats["hits"] == 9
+    assert [r.id for r in cache.get("t").tail] == [f"m{n}" for n in range(10)]
@@ -0,0 +1,17 @@
+import asyncio
+
+from app.services.stages import StageGraph
+
+def test_critical_path_follows_waits_made_at_run_time():
+    graph = StageGraph()
+
+    async def save(_):
+        await asyncio.sleep(0.05)
+
+    async def load(_):
+        await graph.wait("save")
+
+    graph.add("save", save)
+    graph.add("load", load)
+    asyncio.run(graph.run())
+    assert graph.critical_path() == ["save", "load"]
@@ -2,7 +2,7 @@ import React, { useState, useEffect, useRef } from 'react';
 import { FiMessageCircle, FiSend, FiX, FiSun, FiCloud, FiCloudRain, FiMapPin, FiClock, FiDollarSign, FiStar, FiUmbrella, FiCheck } from 'react-icons/fi';
 import { FaBaby, FaWheelchair } from 'react-icons/fa';
 import { useAppSelector } from '../store/hooks';
-import AIService from '../services/AIConciergeService';
+import AIService, { newIdempotencyKey } from '../services/AIConciergeService';
 
 const AIChatOnly = ({ travelerId }) => {
   const [open, setOpen] = useState(false);
@@ -19,6 +19,8 @@ const AIChatOnly = ({ travelerId }) => {
   const isAuthenticated = useAppSelector((state) => state.auth?.isAuthenticated ?? false);
   const currentUserId = useAppSelector((state) => state.auth?.userId ?? null);
   const previousTravelerIdRef = useRef(null);
+  // Last send that failed ({ request, key }); sending the same message again reuses its key
+  const failedSendRef = useRef(null);
 
   // Clear messages when user logs out or when a different user logs in
   useEffect(() => {
@@ -142,7 +144,14 @@ const AIChatOnly = ({ travelerId }) => {
         };
       })() : null;
 
-      const data = await AIService.sendMessage(travelerId, input, bookingContext);
+      // One idempotency key per user message: resending a message whose send failed is a retry
+      // of the same request, so the backend answers it once instead of running it twice
+      const request = JSON.stringify([travelerId, input, bookingContext]);
+      const idempotencyKey = failedSendRef.current?.request === request ? failedSendRef.current.key : newIdempotencyKey();
+      failedSendRef.current = { request, key: idempotencyKey };
+
+      const data = await AIService.sendMessage(travelerId, input, bookingContext, idempotencyKey);
+      failedSendRef.current = null;
       setMessages([...newMessages, { 
         who: 'assistant', 
         text: data.reply,
@@ -27,9 +27,30 @@ const getBaseURL = () => {
   return AI_BASE_URL;
 };
 
+// Random idempotency key. crypto.randomUUID only exists in secure contexts (https, localhost),
+// so plain-http origins such as http://airbnb.local build a v4 UUID from getRandomValues instead
+export const newIdempotencyKey = () => {
+  const c = globalThis.crypto;
+  if (c?.randomUUID) {
+    return c.randomUUID();
+  }
+  const bytes = new Uint8Array(16);
+  if (c?.getRandomValues) {
+    c.getRandomValues(bytes);
+  } else {
+    for (let i = 0; i < bytes.length; i++) bytes[i] = Math.floor(Math.random() * 256);
+  }
+  bytes[6] = (bytes[6] & 0x0f) | 0x40;
+  bytes[8] = (bytes[8] & 0x3f) | 0x80;
+  const hex = Array.from(bytes, (b) => b.toString(16).padStart(2, '0')).join('');
+  return `${hex.slice(0, 8)}-${hex.slice(8, 12)}-${hex.slice(12, 16)}-${hex.slice(16, 20)}-${hex.slice(20)}`;
+};
+
 class AIService {
   // Send a chat message to the backend
-  async sendMessage(travelerId, message, bookingContext = null) {
+  // Create the idempotencyKey once per user message and pass the same key when retrying it,
+  // so the backend runs the request only once
+  async sendMessage(travelerId, message, bookingContext = null, idempotencyKey = newIdempotencyKey()) {
     try {
       const baseUrl = getBaseURL();
       const response = await axios.post(
@@ -42,6 +63,8 @@ class AIService {
         { 
           withCredentials: true,
           timeout: 180000, // 3 minutes timeout (LLM processing can take time)
+          // Ask the server to answer (with a partial itinerary if needed) a little before we give up
+          headers: { 'Idempotency-Key': idempotencyKey, 'X-Request-Timeout': '170' },
         }
       );
       return response.data;